@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from src.pdf_extractor import extract_page_records
+from src.text_normalizer import normalize_records
+from src.retrieval import PassageIndex, get_embedder
+
+@dataclass
+class Document:
+    document_id: str
+    filename: str
+    status: str = "extracting"  # extracting, ready or failed
+    error: str = None
+    text: str = ""
+    index: PassageIndex = None
+    page_count: int = 0
+    created: float = field(default_factory=time.time)
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+
+@dataclass
+class Job:
+    job_id: str
+    document_id: str
+    request_type: str
+    question: str = None
+    status: str = "pending"  # pending, running, done or failed
+    result: str = None
+    error: str = None
+    created: float = field(default_factory=time.time)
+    finished: float = None
+    events: list = field(default_factory=list)
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition)
+
+    async def emit(self, kind: str, data: str):
+        async with self.changed:
+            self.events.append((kind, data))
+            self.changed.notify_all()
+
+class JobManager:
+    """In-process registry of uploaded documents and background processing jobs.
+
+    Extraction and LLM work run as asyncio tasks on the server's event
+    loop; every job shares the one processor (and therefore one model
+    client and completion cache). Finished jobs and idle documents are
+    dropped after `retention` seconds, or earlier once there are more than
+    max_jobs / max_documents of them.
+    """
+
+    def __init__(self, processor, max_extractions: int = 2, search_index=None,
+                 max_documents: int = 200, max_jobs: int = 1000, retention: float = 24 * 3600):
+        self.processor = processor
+        self.search_index = search_index
+        self.max_documents = max_documents
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self.documents: dict[str, Document] = {}
+        self.jobs: dict[str, Job] = {}
+        self._extraction_slots = asyncio.Semaphore(max_extractions)
+        self._tasks = set()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def add_document(self, document_id: str, filename: str, pdf_path: str) -> Document:
+        """Register an uploaded PDF and extract it in the background; uploads of known content are reused."""
+        self._evict()
+        document = self.documents.get(document_id)
+        if document is not None and document.status != "failed":
+            # A running extraction removes the file itself when it finishes
+            if document.status == "ready" and os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            return document
+        document = Document(document_id, filename)
+        self.documents[document_id] = document
+        self._spawn(self._extract(document, pdf_path))
+        return document
+
+    async def delete_document(self, document_id: str) -> bool:
+        """Forget a document and remove it from the search index; False if it was unknown to both."""
+        document = self.documents.pop(document_id, None)
+        if document is not None and document.status == "extracting":
+            # _extract sees the document is gone and does not index it
+            document.status = "failed"
+            document.error = "Document was deleted"
+        indexed = self.search_index is not None and await asyncio.to_thread(self.search_index.delete_document, document_id)
+        return document is not None or indexed
+
+    def _registered(self, document: Document) -> bool:
+        return self.documents.get(document.document_id) is document
+
+    async def _extract(self, document: Document, pdf_path: str):
+        try:
+            async with self._extraction_slots:
+                pages = await asyncio.to_thread(extract_page_records, pdf_path, document.document_id)
+            if not self._registered(document):
+                return
+            texts, _ = await asyncio.to_thread(normalize_records, pages)
+            if self.search_index is not None and self._registered(document):
+                await asyncio.to_thread(self.search_index.add_document, document.document_id, document.filename, texts)
+                if document.document_id not in self.documents:
+                    # Deleted while it was being indexed
+                    await asyncio.to_thread(self.search_index.delete_document, document.document_id)
+            if not self._registered(document):
+                return
+            document.text = "\n".join(texts).strip()
+            # The first call loads the embedding model, so it stays off the event loop too
+            embedder = await asyncio.to_thread(get_embedder)
+            document.index = await asyncio.to_thread(PassageIndex.from_pages, texts, embedder=embedder)
+            document.page_count = len(pages)
+            document.status = "ready"
+        except Exception as e:
+            logging.error(f"Extraction failed for {document.filename}: {e}")
+            document.status = "failed"
+            document.error = str(e)
+        finally:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            document.ready.set()
+
+    def _evict(self):
+        """Drop finished jobs and idle documents past the retention time, then the oldest ones beyond the caps."""
+        cutoff = time.time() - self.retention
+        finished = sorted((job for job in self.jobs.values() if job.finished is not None), key=lambda job: job.finished)
+        excess = len(self.jobs) - self.max_jobs
+        for job in finished:
+            if job.finished > cutoff and excess <= 0:
+                break
+            del self.jobs[job.job_id]
+            excess -= 1
+        busy = {job.document_id for job in self.jobs.values() if job.finished is None}
+        idle = sorted(
+            (document for document in self.documents.values() if document.status != "extracting" and document.document_id not in busy),
+            key=lambda document: document.created
+        )
+        excess = len(self.documents) - self.max_documents
+        for document in idle:
+            if document.created > cutoff and excess <= 0:
+                break
+            del self.documents[document.document_id]
+            excess -= 1
+
+    def submit(self, document_id: str, request_type: str, question: str = None) -> Job:
+        job = Job(uuid.uuid4().hex, document_id, request_type, question)
+        self.jobs[job.job_id] = job
+        # After registering the job, so its document counts as in use
+        self._evict()
+        self._spawn(self._run(job))
+        return job
+
+    async def _run(self, job: Job):
+        try:
+            document = self.documents.get(job.document_id)
+            if document is None:
+                raise RuntimeError("Document was deleted")
+            await document.ready.wait()
+            if document.status != "ready":
+                raise RuntimeError(f"Document extraction failed: {document.error}")
+            job.status = "running"
+            parts = []
+            async for kind, data in self.processor.stream_document(document.text, job.request_type, job.question, document.index):
+                if kind == "text":
+                    parts.append(data)
+                await job.emit(kind, data)
+            job.result = "".join(parts)
+            job.status = "done"
+            await job.emit("done", "")
+        except Exception as e:
+            logging.error(f"Job {job.job_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            await job.emit("error", str(e))
+        finally:
+            async with job.changed:
+                job.finished = time.time()
+                job.changed.notify_all()
+
+    async def follow(self, job: Job):
+        """Yield the job's events from the beginning, waiting for new ones until it finishes."""
+        position = 0
+        while True:
+            async with job.changed:
+                while position == len(job.events) and job.finished is None:
+                    await job.changed.wait()
+                pending = job.events[position:]
+            position += len(pending)
+            for event in pending:
+                yield event
+            if job.finished is not None and position == len(job.events):
+                return
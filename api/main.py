@@ -0,0 +1,160 @@
+"""Async HTTP API in front of LegalDocumentProcessor.
+
+Run with: uvicorn api.main:app --host 0.0.0.0 --port 8000
+
+    POST /documents?filename=x.pdf       raw PDF request body, streamed to disk
+    GET  /documents/{document_id}        extraction status
+    DELETE /documents/{document_id}      forget the document and drop it from the search index
+    POST /documents/{document_id}/jobs   {"request_type": "...", "question": "..."}
+    GET  /jobs/{job_id}                  job status and result (polling)
+    GET  /jobs/{job_id}/events           server-sent events while the job runs
+    GET  /search?q=...&limit=20          pages of all processed documents matching the query
+    GET  /metrics                        Prometheus metrics
+"""
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+# Load environment variables before the agents module reads them
+load_dotenv()
+
+from src.document_processor import LegalDocumentProcessor
+from src.agents import AGENT_PROMPTS
+from src import metrics
+from api.jobs import JobManager
+from src.search_index import search_index_from_env
+
+REQUEST_TYPES = list(AGENT_PROMPTS) + ["chat"]
+UPLOAD_DIR = os.getenv("API_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "smart_legal_uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("API_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+class JobRequest(BaseModel):
+    request_type: str
+    question: Optional[str] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    app.state.jobs = JobManager(
+        LegalDocumentProcessor(),
+        max_extractions=int(os.getenv("API_MAX_EXTRACTIONS", "2")),
+        search_index=search_index_from_env(),
+        max_documents=int(os.getenv("API_MAX_DOCUMENTS", "200")),
+        max_jobs=int(os.getenv("API_MAX_JOBS", "1000")),
+        retention=float(os.getenv("API_RETENTION_HOURS", "24")) * 3600
+    )
+    yield
+
+app = FastAPI(title="Smart Legal Solutions API", lifespan=lifespan)
+
+def document_info(document) -> dict:
+    return {
+        "document_id": document.document_id,
+        "filename": document.filename,
+        "status": document.status,
+        "error": document.error,
+        "pages": document.page_count,
+    }
+
+def job_info(job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "document_id": job.document_id,
+        "request_type": job.request_type,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+        "created": job.created,
+        "finished": job.finished,
+    }
+
+@app.post("/documents", status_code=202)
+async def upload_document(request: Request, filename: str = "document.pdf"):
+    """Stream the raw PDF body to disk while hashing it, then extract it in the background."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for block in request.stream():
+                size += len(block)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="Upload too large")
+                digest.update(block)
+                f.write(block)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        document_id = digest.hexdigest()
+        pdf_path = os.path.join(UPLOAD_DIR, f"{document_id}.pdf")
+        os.replace(temp_path, pdf_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    document = request.app.state.jobs.add_document(document_id, filename, pdf_path)
+    return document_info(document)
+
+@app.get("/documents/{document_id}")
+async def get_document(document_id: str, request: Request):
+    document = request.app.state.jobs.documents.get(document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    return document_info(document)
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str, request: Request):
+    if not await request.app.state.jobs.delete_document(document_id):
+        raise HTTPException(status_code=404, detail="Unknown document")
+    return {"document_id": document_id, "deleted": True}
+
+@app.post("/documents/{document_id}/jobs", status_code=202)
+async def create_job(document_id: str, job_request: JobRequest, request: Request):
+    jobs = request.app.state.jobs
+    if document_id not in jobs.documents:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    if job_request.request_type not in REQUEST_TYPES:
+        raise HTTPException(status_code=422, detail=f"request_type must be one of: {', '.join(REQUEST_TYPES)}")
+    if job_request.request_type == "chat" and not job_request.question:
+        raise HTTPException(status_code=422, detail="chat jobs need a question")
+    job = jobs.submit(document_id, job_request.request_type, job_request.question)
+    return job_info(job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    job = request.app.state.jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job_info(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent events: "progress" and "text" while running, then "done" or "error"."""
+    jobs = request.app.state.jobs
+    job = jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    async def events():
+        async for kind, data in jobs.follow(job):
+            yield f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/search")
+async def search(request: Request, q: str, limit: int = 20):
+    """Page-level hits across every indexed document; quoted text is matched as a phrase."""
+    hits = await asyncio.to_thread(request.app.state.jobs.search_index.search, q, min(max(limit, 1), 100))
+    return {"query": q, "hits": [asdict(hit) for hit in hits]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,31 +1,60 @@
 import os
 import asyncio
+import hashlib
 import logging
+import threading
 import streamlit as st
-from src.pdf_extractor import extract_text_from_pdf
-from src.document_processor import LegalDocumentProcessor
 import json
 from datetime import datetime
-from fpdf import FPDF, XPos, YPos  # Add XPos, YPos import
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables before any src module reads them. The src
+# modules themselves are imported where first needed, so a rerun that
+# only redraws the page does not pay for PyMuPDF, LangChain or SQLAlchemy.
 load_dotenv()
 
 # Get API key from environment or Streamlit secrets
 api_key = os.getenv("OPENAI_API_KEY")  # Changed from OPEN_API_KEY
-if not api_key and hasattr(st, 'secrets'):
+# Without a secrets.toml, st.secrets.get would show an error and raise
+if not api_key and hasattr(st, 'secrets') and st.secrets.load_if_toml_exists():
     api_key = st.secrets.get("OPENAI_API_KEY")  # Changed from OPEN_API_KEY
 
-if not api_key:
+# The offline fake backend (LLM_BACKEND=fake) needs no key
+if not api_key and os.getenv("LLM_BACKEND", "openai").lower() != "fake":
     st.error("OpenAI API key not found! Please check your .env file or Streamlit secrets.")
     st.stop()
 
-os.environ["OPENAI_API_KEY"] = api_key  # Changed from OPEN_API_KEY
+if api_key:
+    os.environ["OPENAI_API_KEY"] = api_key  # Changed from OPEN_API_KEY
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+@st.cache_resource
+def get_job_store():
+    """Document actions are checkpointed here, so a rerun or restart resumes instead of starting over."""
+    from src.job_store import JobStore
+    return JobStore()
+
+@st.cache_resource
+def get_search_index():
+    """Full-text index over every document processed here, kept on disk between runs."""
+    from src.search_index import search_index_from_env
+    return search_index_from_env()
+
+@st.cache_resource
+def get_processor():
+    """One processor, and with it one model client and connection pool, shared by all sessions."""
+    from src.document_processor import LegalDocumentProcessor
+    return LegalDocumentProcessor()
+
+@st.cache_resource
+def get_event_loop():
+    """Background event loop shared by all sessions, so async clients keep their connections across reruns."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+    return loop
+
 def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -45,111 +74,177 @@ def new_chat():
     st.session_state.current_doc = None
     st.session_state.document_processed = False
 
-def create_pdf_from_text(text: str, title: str) -> bytes:
-    """Convert text to PDF and return as bytes"""
-    try:
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Use Helvetica (built-in font) instead of Arial
-        pdf.set_font("helvetica", "B", 16)
-        # Update cell parameters to use new positioning
-        pdf.cell(0, 10, title.encode('latin-1', 'replace').decode('latin-1'), 
-                new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        pdf.ln(10)
-        
-        # Use Helvetica for content
-        pdf.set_font("helvetica", size=12)
-        safe_text = text.encode('latin-1', 'replace').decode('latin-1')
-        pdf.multi_cell(0, 10, safe_text)
-        
-        return bytes(pdf.output())
-    except Exception as e:
-        logging.error(f"Error creating PDF: {e}")
-        raise
-
 def get_download_filename(request_type: str, doc_name: str, ext: str = "pdf") -> str:
     """Generate a filename for downloaded content"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"{request_type}_{doc_name}_{timestamp}.{ext}"
 
+def iterate_async(async_iterable):
+    """Drive an async iterator from synchronous code (e.g. st.write_stream) on the shared event loop."""
+    loop = get_event_loop()
+    iterator = async_iterable.__aiter__()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        if hasattr(iterator, "aclose"):
+            asyncio.run_coroutine_threadsafe(iterator.aclose(), loop).result()
+
+def current_revision(job_store):
+    """Changes of the current document since the version it revises, or None."""
+    version_id = st.session_state.documents[st.session_state.current_doc].get("version_id")
+    return job_store.revision(version_id) if version_id else None
+
+def stream_response(request_type, question=None):
+    """Render the response as it is generated and return the full text."""
+    processor = get_processor()
+    job_store = get_job_store()
+    current = st.session_state.documents[st.session_state.current_doc]
+    job_id = None
+    revision = None
+    if request_type != "chat":
+        job_id = job_store.open_job(current["text"], request_type, version_id=current.get("version_id"))
+        job_store.start(job_id, "streamlit")
+        revision = current_revision(job_store)
+    checkpoint = job_store.checkpoint(job_id, revision) if job_id else None
+    events = iterate_async(processor.stream_document(current["text"], request_type, question, current.get("index"), checkpoint, revision))
+    # Created on the first progress event, so single-call requests show only the text
+    status = None
+
+    def text_deltas():
+        nonlocal status
+        for kind, text in events:
+            if kind == "progress":
+                if status is None:
+                    status = st.status(text)
+                status.update(label=text)
+                status.write(text)
+            else:
+                yield text
+
+    try:
+        response = st.write_stream(text_deltas())
+    except Exception as e:
+        if job_id:
+            job_store.fail(job_id, str(e))
+        if status is not None:
+            status.update(label="Failed", state="error")
+        raise
+    if job_id:
+        job_store.complete(job_id, response)
+    if revision is not None:
+        job_store.save_chunks(current["text"], revision.chunks)
+    if status is not None:
+        status.update(label="Done", state="complete")
+    return response
+
+# Friendly names for the action types
+ACTION_NAMES = {
+    "summary": "Summary",
+    "appeal": "Appeal",
+    "review": "Review",
+    "lawsuit": "Lawsuit",
+    "lawsuit_response": "Lawsuit Response",
+    "contract_analysis": "Contract Analysis",
+    "chat": "Chat Response"
+}
+
+def show_download_button(request_type, response):
+    """Offer the response as a PDF download."""
+    doc_name = st.session_state.current_doc.split('.')[0]
+    
+    # Ensure PDF extension
+    filename = get_download_filename(request_type, doc_name, "pdf")
+    
+    try:
+        action_name = ACTION_NAMES.get(request_type, request_type.title())
+        
+        # Convert response to PDF with error handling
+        title = f"{action_name} - {doc_name}"
+        from src.pdf_export import create_pdf_from_text
+        pdf_content = create_pdf_from_text(response, title)
+        
+        # Center the download button with wider columns
+        left_col, center_col, right_col = st.columns([2, 3, 2])  # Changed ratio to make center column wider
+        with center_col:
+            st.download_button(
+                label=f"📥 Download {action_name}",
+                data=pdf_content,
+                file_name=filename,
+                mime="application/pdf",
+                key=f"download_{request_type}_{datetime.now().strftime('%H%M%S')}",
+                use_container_width=True  # Ensure button uses full width of column
+            )
+    except Exception as pdf_error:
+        st.error(f"Error creating PDF: {pdf_error}")
+
 def process_request(request_type, question=None):
     try:
-        processor = LegalDocumentProcessor()
-        with st.spinner("Processing..."):
-            result = asyncio.run(processor.process_document(
-                st.session_state.documents[st.session_state.current_doc]["text"], 
-                request_type,
-                question
-            ))
+        # Add spacing after buttons
+        st.write("\n")
+        st.divider()
+        
+        # Create full-width response container
+        st.markdown("### Generated Response")
+        response = stream_response(request_type, question)
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": response
+        })
+        
+        # Add download button in a separate row
+        st.write("")  # Add space
+        show_download_button(request_type, response)
             
-            if "error" in result:
-                response = f"Error: {result['error']}"
-                st.error(response)
-            else:
-                response = result["result"]
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                
-                # Add spacing after buttons
-                st.write("\n")
-                st.divider()
-                
-                # Create full-width response container
-                st.markdown("### Generated Response")
-                st.write(response)
-                
-                # Add download button in a separate row
-                st.write("")  # Add space
-                doc_name = st.session_state.current_doc.split('.')[0]
-                
-                # Ensure PDF extension
-                filename = get_download_filename(request_type, doc_name, "pdf")
-                
-                try:
-                    # Get friendly name for the action type
-                    action_names = {
-                        "summary": "Summary",
-                        "appeal": "Appeal",
-                        "review": "Review",
-                        "lawsuit": "Lawsuit",
-                        "lawsuit_response": "Lawsuit Response",
-                        "contract_analysis": "Contract Analysis",
-                        "chat": "Chat Response"
-                    }
-                    action_name = action_names.get(request_type, request_type.title())
-                    
-                    # Convert response to PDF with error handling
-                    title = f"{action_name} - {doc_name}"
-                    pdf_content = create_pdf_from_text(response, title)
-                    
-                    # Center the download button with wider columns
-                    left_col, center_col, right_col = st.columns([2, 3, 2])  # Changed ratio to make center column wider
-                    with center_col:
-                        st.download_button(
-                            label=f"📥 Download {action_name}",
-                            data=pdf_content,
-                            file_name=filename,
-                            mime="application/pdf",
-                            key=f"download_{request_type}_{datetime.now().strftime('%H%M%S')}",
-                            use_container_width=True  # Ensure button uses full width of column
-                        )
-                except Exception as pdf_error:
-                    st.error(f"Error creating PDF: {pdf_error}")
-                    
-                # Add final divider
-                st.write("")
-                st.divider()
-                
-            return response
+        # Add final divider
+        st.write("")
+        st.divider()
+        
+        return response
     except Exception as e:
         error_msg = f"Error processing request: {str(e)}"
         logging.error(error_msg)
         st.error(error_msg)
         return error_msg
 
+def process_requests(request_types):
+    """Run several actions over the current document in one pass, showing each result as soon as it finishes."""
+    st.write("\n")
+    st.divider()
+    st.markdown("### Generated Responses")
+    processor = get_processor()
+    job_store = get_job_store()
+    current = st.session_state.documents[st.session_state.current_doc]
+    job_ids = {request_type: job_store.open_job(current["text"], request_type, version_id=current.get("version_id")) for request_type in request_types}
+    for job_id in job_ids.values():
+        job_store.start(job_id, "streamlit")
+    revision = current_revision(job_store)
+    checkpoints = {request_type: job_store.checkpoint(job_id, revision) for request_type, job_id in job_ids.items()}
+    status = st.status(f"Running {len(request_types)} actions")
+    results = iterate_async(processor.process_actions(current["text"], request_types, checkpoints, revision))
+    for done, (request_type, result) in enumerate(results, start=1):
+        action_name = ACTION_NAMES.get(request_type, request_type.title())
+        status.update(label=f"Finished {done} of {len(request_types)} actions")
+        st.markdown(f"#### {action_name}")
+        if "error" in result:
+            job_store.fail(job_ids[request_type], result["error"])
+            st.error(f"Error processing {action_name}: {result['error']}")
+            continue
+        job_store.complete(job_ids[request_type], result["result"])
+        st.markdown(result["result"])
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": result["result"]
+        })
+        show_download_button(request_type, result["result"])
+        st.divider()
+    if revision is not None:
+        job_store.save_chunks(current["text"], revision.chunks)
+    status.update(label="Done", state="complete")
+
 def show_user_manual():
     with st.expander("📖 User Manual - How to Use Smart Legal Solutions"):
         st.markdown("""
@@ -165,6 +260,8 @@ def show_user_manual():
            * Click "Process" button next to each uploaded document
            * Wait for confirmation message
            * Document is ready for analysis when processing completes
+           * For a new version of a processed document, pick the earlier one under "is a revision of" first: only the changed parts are re-analyzed and the changes are highlighted
+           * Processed documents are added to the search index: "Search all documents" in the sidebar finds pages across everything processed so far (Latin or Cyrillic, with or without diacritics; put phrases in quotes)
 
         ## 💡 Available Features
 
@@ -241,30 +338,56 @@ def main():
         
         if uploaded_files:
             for uploaded_file in uploaded_files:
-                if uploaded_file.name not in st.session_state.documents:
-                    pdf_path = f"temp_{uploaded_file.name}"
-                    try:
-                        with open(pdf_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
-                        
-                        if st.button(f"Process {uploaded_file.name}"):
-                            with st.spinner(f"Processing {uploaded_file.name}..."):
-                                try:
-                                    text = extract_text_from_pdf(pdf_path)
-                                    st.session_state.documents[uploaded_file.name] = {
-                                        "text": text,
-                                        "processed": True
-                                    }
-                                    st.session_state.current_doc = uploaded_file.name
-                                    st.session_state.document_processed = True
-                                    st.session_state.messages.append({
-                                        "role": "assistant",
-                                        "content": f"I've processed {uploaded_file.name}. You can use the dropdown below to select an action."
-                                    })
-                                except Exception as e:
-                                    st.error(f"Error processing {uploaded_file.name}: {str(e)}")
-                    except Exception as e:
-                        st.error(f"Error handling {uploaded_file.name}: {str(e)}")
+                if uploaded_file.name in st.session_state.documents:
+                    continue
+                # A new version of a processed document is analyzed incrementally
+                revises = None
+                if st.session_state.documents:
+                    revises = st.selectbox(
+                        f"{uploaded_file.name} is a revision of:",
+                        options=[None, *st.session_state.documents],
+                        format_func=lambda name: "(new document)" if name is None else name,
+                        key=f"revises_{uploaded_file.name}"
+                    )
+                # Nothing is read or written until the user asks for the document to be processed
+                if st.button(f"Process {uploaded_file.name}"):
+                    with st.spinner(f"Processing {uploaded_file.name}..."):
+                        try:
+                            from src.pdf_extractor import iter_page_records
+                            from src.retrieval import PassageIndex, get_embedder
+                            from src.text_normalizer import normalize_records
+                            progress = st.progress(0.0)
+                            # Read and hashed once: the hash keys both the extraction cache and the search index
+                            data = uploaded_file.getvalue()
+                            digest = hashlib.sha256(data).hexdigest()
+                            # Extracted straight from the upload buffer, without a temp file
+                            records = iter_page_records(
+                                data,
+                                lambda done, total, page: progress.progress(done / total, text=f"Page {done} of {total} ({page.source})"),
+                                content_hash=digest
+                            )
+                            pages, normalization = normalize_records(records)
+                            progress.empty()
+                            text = "\n".join(pages).strip()
+                            previous_id = st.session_state.documents[revises].get("version_id") if revises else None
+                            version = get_job_store().add_version(text, uploaded_file.name, previous_id)
+                            get_search_index().add_document(digest, uploaded_file.name, pages)
+                            st.session_state.documents[uploaded_file.name] = {
+                                "text": text,
+                                "index": PassageIndex.from_pages(pages, embedder=get_embedder()),
+                                "version_id": version.id,
+                                "processed": True
+                            }
+                            st.session_state.current_doc = uploaded_file.name
+                            st.session_state.document_processed = True
+                            revised = f" as version {version.number} of {revises}" if revises else ""
+                            st.session_state.messages.append({
+                                "role": "assistant",
+                                "content": f"I've processed {uploaded_file.name}{revised} (removed {normalization.saved_ratio:.0%} repeated headers, footers and scan noise). "
+                                           "You can use the dropdown below to select an action."
+                            })
+                        except Exception as e:
+                            st.error(f"Error processing {uploaded_file.name}: {str(e)}")
 
         # Document selector
         if st.session_state.documents:
@@ -279,6 +402,16 @@ def main():
                 st.session_state.current_doc = selected_doc
                 st.session_state.document_processed = True
 
+        st.divider()
+        st.subheader("Search All Documents")
+        query = st.text_input("Search all documents", placeholder='npr. "član 154" naknada štete', key="search_query")
+        if query:
+            hits = get_search_index().search(query, limit=10)
+            if not hits:
+                st.caption("No matches.")
+            for hit in hits:
+                st.markdown(f"**{hit.name}**, page {hit.page}\n\n{hit.snippet}")
+
         st.divider()
         st.header("Chat Controls")
         col1, col2 = st.columns(2)
@@ -299,13 +432,14 @@ def main():
         st.divider()
         st.subheader(f"Actions for: {st.session_state.current_doc}")
         
-        # Dropdown menu for actions
-        action = st.selectbox(
-            "Select an action:",
-            ["Instant Legal Documnet Summary", "Appeal Builder Pro", "Smart Document Review", "Lawsuit Builder", "Defense Builder", "Smart Contract Analyzer"]
+        # Multi-select menu for actions; several actions run together in one pass
+        actions = st.multiselect(
+            "Select actions:",
+            ["Instant Legal Documnet Summary", "Appeal Builder Pro", "Smart Document Review", "Lawsuit Builder", "Defense Builder", "Smart Contract Analyzer"],
+            default=["Instant Legal Documnet Summary"]
         )
         
-        if st.button("Execute Action"):
+        if st.button("Execute Action", disabled=not actions):
             action_map = {
                 "Instant Legal Documnet Summary": "summary",
                 "Appeal Builder Pro": "appeal",
@@ -314,7 +448,10 @@ def main():
                 "Defense Builder": "lawsuit_response",
                 "Smart Contract Analyzer": "contract_analysis"
             }
-            process_request(action_map[action])
+            if len(actions) == 1:
+                process_request(action_map[actions[0]])
+            else:
+                process_requests([action_map[action] for action in actions])
 
     # Update chat input handler
     if prompt := st.chat_input("Ask any question about the document..." if st.session_state.document_processed else "Please upload and process a document first"):
@@ -342,23 +479,15 @@ def main():
                     break
         else:
             # Use chat helper for general questions
-            processor = LegalDocumentProcessor()
             with st.chat_message("assistant"):
-                with st.spinner("Analyzing document and preparing response..."):
-                    result = asyncio.run(processor.process_document(
-                        st.session_state.documents[st.session_state.current_doc]["text"],
-                        "chat",
-                        prompt
-                    ))
-                    
-                    if "error" in result:
-                        st.error(result["error"])
-                    else:
-                        st.markdown(result["result"])
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": result["result"]
-                        })
+                try:
+                    response = stream_response("chat", prompt)
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": response
+                    })
+                except Exception as e:
+                    st.error(str(e))
 
 # Add credits at the bottom of sidebar
 st.sidebar.markdown("**Upload Your Legal Documents here for Automation**")
@@ -0,0 +1,198 @@
+"""Headless batch runner: extract and analyze every PDF in a directory or glob.
+
+Example:
+    python batch.py incoming/ --actions summary,review --output results.jsonl --pdf-dir out/
+
+Results are appended to the JSONL file as each item finishes. Re-running
+with the same output file skips (document, action) pairs that already
+succeeded, so an interrupted run resumes where it stopped.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables before the agents module reads them
+load_dotenv()
+
+from src.pdf_extractor import iter_page_records, worker_context
+from src.text_normalizer import normalize_records
+from src.search_index import search_index_from_env
+from src.document_processor import LegalDocumentProcessor
+from src.pdf_export import create_pdf_from_text
+from src.llm_scheduler import BATCH, priority_scope
+from src.metrics import serve_metrics
+
+ACTIONS = ["summary", "appeal", "review", "lawsuit", "lawsuit_response", "contract_analysis"]
+
+def find_pdfs(inputs: list[str]) -> list[str]:
+    """Expand directories (recursively) and glob patterns into absolute PDF paths."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True)
+        else:
+            matches = glob.glob(item, recursive=True)
+        paths.extend(os.path.abspath(path) for path in matches if path.lower().endswith(".pdf"))
+    return sorted(set(paths))
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_finished(output_path: str) -> set[tuple[str, str]]:
+    """Return the (sha256, action) pairs that already have a successful result."""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line behind
+                continue
+            if record.get("status") == "ok":
+                finished.add((record["sha256"], record["action"]))
+    return finished
+
+def extract_document(path: str, sha256: str) -> list[str]:
+    """Extract and normalize one document in a worker process (pages are extracted serially inside it)."""
+    pages, _ = normalize_records(iter_page_records(path, workers=1, content_hash=sha256))
+    return pages
+
+class BatchRunner:
+    """Two-stage pipeline: extraction in a process pool feeding a pool of concurrent LLM tasks.
+
+    Each LLM task runs all pending actions of one document together, so the
+    document is chunked once and its actions share the model scheduler.
+    """
+
+    def __init__(self, actions: list[str], output_path: str, pdf_dir: str = None, extract_workers: int = 2, llm_concurrency: int = 4):
+        self.actions = actions
+        self.output_path = output_path
+        self.pdf_dir = pdf_dir
+        self.extract_workers = extract_workers
+        self.llm_concurrency = llm_concurrency
+        self.processor = LegalDocumentProcessor()
+        self.search_index = search_index_from_env()
+        self.stats = {"ok": 0, "error": 0, "skipped": 0}
+
+    async def run(self, paths: list[str]):
+        finished = load_finished(self.output_path)
+        if self.pdf_dir:
+            os.makedirs(self.pdf_dir, exist_ok=True)
+        # Bounded, and each extractor waits for its document to be queued before taking the next path,
+        # so at most extract_workers + 2 * llm_concurrency extracted documents are held in memory
+        queue = asyncio.Queue(maxsize=self.llm_concurrency * 2)
+        pending_paths = asyncio.Queue()
+        for path in paths:
+            pending_paths.put_nowait(path)
+        pool = ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=worker_context())
+        with open(self.output_path, "a", encoding="utf-8") as output, pool:
+            consumers = [asyncio.create_task(self._llm_worker(queue, output)) for _ in range(self.llm_concurrency)]
+            producers = [asyncio.create_task(self._extract_worker(pending_paths, finished, pool, queue, output)) for _ in range(self.extract_workers)]
+            await asyncio.gather(*producers)
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+        return self.stats
+
+    async def _extract_worker(self, pending_paths, finished, pool, queue, output):
+        while not pending_paths.empty():
+            await self._extract(pending_paths.get_nowait(), finished, pool, queue, output)
+
+    async def _extract(self, path, finished, pool, queue, output):
+        sha256 = await asyncio.to_thread(file_sha256, path)
+        pending = [action for action in self.actions if (sha256, action) not in finished]
+        self.stats["skipped"] += len(self.actions) - len(pending)
+        if not pending:
+            return
+        started = time.perf_counter()
+        try:
+            pages = await asyncio.get_running_loop().run_in_executor(pool, extract_document, path, sha256)
+        except Exception as e:
+            logging.error(f"Extraction failed for {path}: {e}")
+            for action in pending:
+                self._write(output, path, sha256, action, {"error": f"Extraction failed: {e}"}, 0.0)
+            return
+        extract_seconds = time.perf_counter() - started
+        await asyncio.to_thread(self.search_index.add_document, sha256, os.path.basename(path), pages)
+        text = "\n".join(pages).strip()
+        await queue.put((path, sha256, pending, text, extract_seconds))
+
+    async def _llm_worker(self, queue, output):
+        while (item := await queue.get()) is not None:
+            path, sha256, actions, text, extract_seconds = item
+            started = time.perf_counter()
+            async for action, result in self.processor.process_actions(text, actions):
+                self._write(output, path, sha256, action, result, time.perf_counter() - started, extract_seconds)
+
+    def _write(self, output, path, sha256, action, result, llm_seconds, extract_seconds=0.0):
+        status = "error" if "error" in result else "ok"
+        record = {
+            "file": path,
+            "sha256": sha256,
+            "action": action,
+            "status": status,
+            "result": result.get("result"),
+            "error": result.get("error"),
+            "extract_seconds": round(extract_seconds, 3),
+            "llm_seconds": round(llm_seconds, 3),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if status == "ok" and self.pdf_dir:
+            doc_name = os.path.splitext(os.path.basename(path))[0]
+            pdf_path = os.path.join(self.pdf_dir, f"{action}_{doc_name}_{sha256[:8]}.pdf")
+            try:
+                with open(pdf_path, "wb") as f:
+                    f.write(create_pdf_from_text(record["result"], f"{action} - {doc_name}"))
+                record["pdf"] = pdf_path
+            except Exception as e:
+                logging.error(f"Error writing PDF for {path}: {e}")
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        self.stats[status] += 1
+        logging.info(f"{status}: {action} {path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-process legal PDFs without the Streamlit UI.")
+    parser.add_argument("inputs", nargs="+", help="directories (searched recursively) or glob patterns")
+    parser.add_argument("--actions", default="summary", help=f"comma-separated request types: {', '.join(ACTIONS)}")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL results file, also used to resume")
+    parser.add_argument("--pdf-dir", help="also write each result as a PDF into this directory")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1, help="documents extracted in parallel")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="documents sent to the LLM in parallel (with all their actions)")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port while running")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    actions = [action.strip() for action in args.actions.split(",") if action.strip()]
+    unknown = [action for action in actions if action not in ACTIONS]
+    if unknown:
+        parser.error(f"unknown actions: {', '.join(unknown)}")
+    paths = find_pdfs(args.inputs)
+    if not paths:
+        parser.error("no PDF files found")
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    runner = BatchRunner(actions, args.output, args.pdf_dir, args.extract_workers, args.llm_concurrency)
+    # Batch calls yield to interactive chat when they share the rate limits
+    with priority_scope(BATCH):
+        stats = asyncio.run(runner.run(paths))
+    print(json.dumps(stats))
+    return 1 if stats["error"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
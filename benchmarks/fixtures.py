@@ -0,0 +1,73 @@
+"""Generated PDF fixtures for the benchmarks: text-layer, scanned (image-only) and mixed documents."""
+import os
+import random
+import fitz
+
+FIXTURE_KINDS = ("text", "scanned", "mixed")
+
+SAMPLE_TEXT = (
+    "Član {n}\n"
+    "Ugovorne strane su saglasne da se zakupnina plaća mesečno, najkasnije do petog u mesecu.\n"
+    "U slučaju kašnjenja zakupac duguje zakonsku zateznu kamatu u skladu sa Zakonom o obligacionim odnosima."
+)
+
+CLAUSES = [
+    "Zakupodavac se obavezuje da zakupcu preda nepokretnost u stanju podobnom za ugovorenu upotrebu.",
+    "Zakupac je dužan da nepokretnost koristi pažnjom dobrog domaćina i u skladu sa njenom namenom.",
+    "Troškove tekućeg održavanja snosi zakupac, a troškove investicionog održavanja zakupodavac.",
+    "Ugovor se zaključuje na određeno vreme od pet godina i može se produžiti aneksom.",
+    "Svaka strana može otkazati ugovor uz otkazni rok od trideset dana u pisanoj formi.",
+    "Za sporove iz ovog ugovora nadležan je Privredni sud u Beogradu.",
+    "Ugovorna kazna za svaki dan kašnjenja iznosi 0,1% od mesečne zakupnine.",
+    "Strane su saglasne da se na sva pitanja koja nisu uređena ovim ugovorom primenjuju odredbe Zakona o obligacionim odnosima.",
+]
+
+def page_text(n: int) -> str:
+    """Deterministic, article-structured legal text for page n (about 350 words)."""
+    rng = random.Random(n)
+    paragraphs = [SAMPLE_TEXT.format(n=n)]
+    for _ in range(6):
+        paragraphs.append(" ".join(rng.choice(CLAUSES) for _ in range(4)))
+    return "\n\n".join(paragraphs)
+
+def _text_page(doc: fitz.Document, n: int):
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(56, 56, 539, 786), page_text(n), fontsize=9)
+
+def _scanned_page(doc: fitz.Document, n: int, dpi: int):
+    """Rasterize a text page and insert only the image, as a scanner would."""
+    source = fitz.open()
+    _text_page(source, n)
+    pix = source[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    page = doc.new_page(width=source[0].rect.width, height=source[0].rect.height)
+    page.insert_image(page.rect, pixmap=pix)
+    source.close()
+
+def make_pdf(kind: str, pages: int, dpi: int = 150) -> fitz.Document:
+    """Build a fixture document; "mixed" alternates text and scanned pages with a blank page every tenth."""
+    if kind not in FIXTURE_KINDS:
+        raise ValueError(f"Unknown fixture kind: {kind}")
+    doc = fitz.open()
+    for n in range(1, pages + 1):
+        if kind == "text" or (kind == "mixed" and n % 2):
+            _text_page(doc, n)
+        elif kind == "mixed" and n % 10 == 0:
+            doc.new_page()
+        else:
+            _scanned_page(doc, n, dpi)
+    return doc
+
+def make_scanned_pdf(pages: int) -> fitz.Document:
+    """Build an image-only PDF by rasterizing text pages, as a scanner would."""
+    return make_pdf("scanned", pages, dpi=200)
+
+def fixture_path(kind: str, pages: int, directory: str, dpi: int = 150) -> str:
+    """Path of a generated fixture, created on first use and reused by later runs."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}_{pages}p_{dpi}dpi.pdf")
+    if not os.path.exists(path):
+        doc = make_pdf(kind, pages, dpi)
+        doc.save(path + ".part", garbage=3, deflate=True)
+        doc.close()
+        os.replace(path + ".part", path)
+    return path
@@ -0,0 +1,42 @@
+"""Compare OCR throughput (pages/sec) of the legacy per-page path and OcrEngine.
+
+Usage: python -m benchmarks.ocr_benchmark [--pages N] [--dpi DPI]
+"""
+import argparse
+import json
+import time
+import pytesseract
+from PIL import Image
+from src.pdf_extractor import OcrEngine, setup_tesseract
+from benchmarks.fixtures import make_scanned_pdf
+
+def legacy_ocr(page) -> str:
+    """The extraction path before OcrEngine: setup, 72 DPI RGB render, copy, fresh tesseract process."""
+    setup_tesseract()
+    pix = page.get_pixmap()
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    return pytesseract.image_to_string(img, lang="srp")
+
+def measure(name: str, doc, recognize) -> dict:
+    started = time.perf_counter()
+    characters = sum(len(recognize(page)) for page in doc)
+    elapsed = time.perf_counter() - started
+    return {"name": name, "pages": len(doc), "seconds": elapsed, "pages_per_sec": len(doc) / elapsed, "characters": characters}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--dpi", type=int, default=300)
+    args = parser.parse_args()
+
+    doc = make_scanned_pdf(args.pages)
+    engine = OcrEngine(dpi=args.dpi)
+    results = [
+        measure("legacy_72dpi_rgb", doc, legacy_ocr),
+        measure(f"engine_{args.dpi}dpi_gray", doc, engine.recognize),
+    ]
+    engine.close()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Performance benchmarks for extraction, OCR, chunking and end-to-end processing.
+
+Usage:
+    python -m benchmarks.run_benchmarks [--suites extraction,chunking,end_to_end]
+        [--sizes 1,10,100,500] [--ocr-sizes 1,10] [--output results.json]
+        [--baseline previous.json --tolerance 0.2]
+
+Fixture PDFs are generated on first use (see benchmarks/fixtures.py) and
+every run disables the extraction and completion caches and near-duplicate
+reuse. End-to-end runs use the fake LLM backend, so no network or API key
+is needed; its timing is set with the FAKE_LLM_* variables.
+
+Results are written as JSON, one entry per measurement with a stable
+"id". With --baseline, entries whose time grew by more than the tolerance
+are reported and the exit status is 1.
+"""
+import os
+
+# Benchmarks must measure work, not cache hits or the real provider
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", "50")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ["LLM_CACHE_DISABLED"] = "1"
+os.environ["EXTRACTION_CACHE_DISABLED"] = "1"
+os.environ["NEAR_DUPLICATE_DISABLED"] = "1"
+
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+from collections import Counter
+import fitz
+import pytesseract
+from benchmarks.fixtures import FIXTURE_KINDS, fixture_path, page_text
+from src import agents
+from src.chunker import count_tokens
+from src.pdf_extractor import iter_page_records
+from src.document_processor import LegalDocumentProcessor
+
+SUITES = ("extraction", "chunking", "end_to_end")
+CHUNKING_TYPES = ("summary", "contract_analysis")
+FIXTURE_DIR = os.getenv("BENCHMARK_FIXTURE_DIR", os.path.join(".cache", "benchmark_fixtures"))
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def document_text(pages: int) -> str:
+    return "\n".join(page_text(n) for n in range(1, pages + 1))
+
+def ocr_available() -> bool:
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def bench_extraction(sizes: list[int], ocr_sizes: list[int], workers: int) -> list[dict]:
+    results = []
+    has_ocr = ocr_available()
+    for kind in FIXTURE_KINDS:
+        for pages in (sizes if kind == "text" else ocr_sizes):
+            result_id = f"extraction/{kind}/{pages}p"
+            if kind != "text" and not has_ocr:
+                results.append({"id": result_id, "skipped": "tesseract not installed"})
+                continue
+            path = fixture_path(kind, pages, FIXTURE_DIR)
+            started = time.perf_counter()
+            records = list(iter_page_records(path, workers=workers))
+            elapsed = time.perf_counter() - started
+            results.append({
+                "id": result_id,
+                "pages": pages,
+                "workers": workers,
+                "seconds": elapsed,
+                "pages_per_sec": pages / elapsed,
+                "sources": dict(Counter(record.source for record in records)),
+            })
+            logging.info(f"{result_id}: {pages / elapsed:.1f} pages/s")
+    return results
+
+def bench_chunking(sizes: list[int], repeat: int) -> list[dict]:
+    results = []
+    for pages in sizes:
+        text = document_text(pages)
+        tokens = count_tokens(text)
+        for request_type in CHUNKING_TYPES:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                chunks = agents.chunk_document(text, request_type)
+                timings.append(time.perf_counter() - started)
+            elapsed = statistics.median(timings)
+            result_id = f"chunking/{request_type}/{pages}p"
+            results.append({
+                "id": result_id,
+                "pages": pages,
+                "characters": len(text),
+                "tokens": tokens,
+                "chunks": len(chunks),
+                "seconds": elapsed,
+                "tokens_per_sec": tokens / elapsed,
+                "mb_per_sec": len(text.encode("utf-8")) / elapsed / 1e6,
+            })
+            logging.info(f"{result_id}: {tokens / elapsed:,.0f} tokens/s")
+    return results
+
+async def bench_end_to_end(sizes: list[int], request_types: list[str], concurrency: int) -> list[dict]:
+    processor = LegalDocumentProcessor()
+    results = []
+    for pages in sizes:
+        text = document_text(pages)
+        for request_type in request_types:
+            calls_before = agents.get_model().calls
+            started = time.perf_counter()
+            result = await processor.process_document(text, request_type)
+            latency = time.perf_counter() - started
+            calls = agents.get_model().calls - calls_before
+            if "error" in result:
+                raise RuntimeError(f"{request_type} on {pages} pages failed: {result['error']}")
+
+            # Distinct documents, so concurrent runs share nothing but the scheduler
+            documents = [f"Predmet {i}\n{text}" for i in range(concurrency)]
+            started = time.perf_counter()
+            await asyncio.gather(*(processor.process_document(document, request_type) for document in documents))
+            elapsed = time.perf_counter() - started
+            result_id = f"end_to_end/{request_type}/{pages}p"
+            results.append({
+                "id": result_id,
+                "pages": pages,
+                "model_calls": calls,
+                "seconds": latency,
+                "concurrency": concurrency,
+                "documents_per_sec": concurrency / elapsed,
+                "pages_per_sec": concurrency * pages / elapsed,
+            })
+            logging.info(f"{result_id}: {latency:.2f}s latency, {concurrency / elapsed:.2f} documents/s")
+    return results
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """Entries whose time grew by more than `tolerance` (0.2 = 20%) relative to the baseline."""
+    previous = {entry["id"]: entry for entry in baseline if "seconds" in entry}
+    regressions = []
+    for entry in results:
+        before = previous.get(entry["id"])
+        if before is None or "seconds" not in entry:
+            continue
+        ratio = entry["seconds"] / before["seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append({"id": entry["id"], "baseline_seconds": before["seconds"], "seconds": entry["seconds"], "ratio": ratio})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks and write the results as JSON.")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma-separated: {', '.join(SUITES)}")
+    parser.add_argument("--sizes", default="1,10,100,500", help="page counts for text extraction and chunking")
+    parser.add_argument("--ocr-sizes", default="1,10", help="page counts for scanned and mixed fixtures")
+    parser.add_argument("--e2e-sizes", default="1,10,100", help="page counts for end-to-end processing")
+    parser.add_argument("--e2e-actions", default="summary,contract_analysis", help="request types for end-to-end processing")
+    parser.add_argument("--concurrency", type=int, default=4, help="documents processed at once for the throughput figure")
+    parser.add_argument("--workers", type=int, default=None, help="extraction worker processes (default: EXTRACTION_WORKERS)")
+    parser.add_argument("--repeat", type=int, default=3, help="chunking repetitions; the median is reported")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)}")
+
+    results = []
+    if "extraction" in suites:
+        results += bench_extraction(int_list(args.sizes), int_list(args.ocr_sizes), args.workers)
+    if "chunking" in suites:
+        results += bench_chunking(int_list(args.sizes), args.repeat)
+    if "end_to_end" in suites:
+        actions = [action.strip() for action in args.e2e_actions.split(",") if action.strip()]
+        results += asyncio.run(bench_end_to_end(int_list(args.e2e_sizes), actions, args.concurrency))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pymupdf": fitz.VersionBind,
+            "llm_backend": os.environ["LLM_BACKEND"],
+            "settings": {name: value for name, value in os.environ.items() if name.startswith(("FAKE_LLM_", "LLM_", "OCR_", "EXTRACTION_", "CHUNK_", "REDUCE_"))},
+        },
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in report["regressions"]:
+            logging.warning(f"Regression in {regression['id']}: {regression['baseline_seconds']:.3f}s -> {regression['seconds']:.3f}s")
+        status = 1 if report["regressions"] else 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,72 @@
 import os
+import asyncio
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from src.chunker import chunk_text, rechunk_text, count_tokens
+from src.retrieval import PassageIndex, get_embedder
+from src.llm_cache import LLMCache, cache_from_env
+from src.near_duplicates import NearDuplicate, NearDuplicateIndex, near_duplicate_index_from_env, word_diff
+from src.llm_scheduler import INTERACTIVE, scheduler_from_env
+from src.llm_backend import create_model
+from src.revisions import Revision, changes_for_prompt, render_changes
+from src import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Get API key from environment
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
-# Initialize model with environment variable
-model = ChatOpenAI(
-    model="gpt-5-2025-08-07",  
-    openai_api_key=api_key,
-    temperature=0.7
+# Maximum number of chunk requests an agent keeps in flight at once
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+MODEL_NAME = "gpt-5-2025-08-07"
+MODEL_TEMPERATURE = 0.7
+
+# Bump whenever a prompt template changes so cached completions are not reused
+PROMPT_VERSION = "3"
+
+# Target chunk size in tokens per request type. Outputs that are drafted from the
+# whole case (appeal, lawsuit) get larger chunks, clause-level analyses smaller ones.
+CHUNK_TOKEN_TARGETS = {
+    "summary": 12000,
+    "appeal": 10000,
+    "review": 8000,
+    "lawsuit": 10000,
+    "lawsuit_response": 10000,
+    "contract_analysis": 6000,
+}
+DEFAULT_CHUNK_TOKENS = 8000
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
+
+# Number of document passages retrieved for each chat question
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", "6"))
+
+# Number of intermediate notes merged by a single reduce call
+REDUCE_FAN_IN = int(os.getenv("REDUCE_FAN_IN", "4"))
+
+# Completion size assumed when reserving tokens-per-minute budget for a call
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "1500"))
+
+# Request types whose chunk notes may be reused for near-identical template text
+NEAR_DUPLICATE_TYPES = tuple(
+    request_type.strip() for request_type in os.getenv("NEAR_DUPLICATE_TYPES", "contract_analysis,review").split(",")
+    if request_type.strip()
 )
 
+@lru_cache(maxsize=None)
+def get_model():
+    """Chat model selected by LLM_BACKEND, created on first use: "openai" (needs OPENAI_API_KEY) or the offline "fake"."""
+    return create_model(MODEL_NAME, MODEL_TEMPERATURE)
+
+# Shared completion cache (see LLM_CACHE_* environment variables)
+llm_cache = cache_from_env()
+
+# Notes of previously analyzed chunks, matched by similarity (see NEAR_DUPLICATE_* environment variables)
+near_duplicates = near_duplicate_index_from_env()
+
+# Shared rate limiter, retry and priority queue for every model call (see LLM_RPM, LLM_TPM)
+scheduler = scheduler_from_env()
+
 # Define prompt templates and message creation
 def create_messages(prompt: str, document: str):
     return [
@@ -26,23 +74,263 @@ def create_messages(prompt: str, document: str):
         HumanMessage(content=prompt.format(document=document))
     ]
 
-def chunk_document(document: str, max_length: int = 5000) -> list[str]:
-    chunks = []
-    start = 0
-    while start < len(document):
-        end = min(start + max_length, len(document))
-        chunks.append(document[start:end])
-        start = end
+def chunk_document(document: str, request_type: str = None, max_tokens: int = None, overlap_tokens: int = None) -> list[str]:
+    """Split a document into token-budgeted chunks sized for the given request type."""
+    return chunk_text(
+        document,
+        max_tokens=max_tokens or CHUNK_TOKEN_TARGETS.get(request_type, DEFAULT_CHUNK_TOKENS),
+        overlap_tokens=CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens,
+        model_name=MODEL_NAME
+    )
+
+def chunk_document_for_actions(document: str, request_types) -> dict[str, list[str]]:
+    """Chunk a document once per distinct chunk size needed by the given request types."""
+    by_size = {}
+    chunks = {}
+    for request_type in request_types:
+        size = CHUNK_TOKEN_TARGETS.get(request_type, DEFAULT_CHUNK_TOKENS)
+        if size not in by_size:
+            by_size[size] = chunk_document(document, request_type)
+        chunks[request_type] = by_size[size]
     return chunks
 
-async def legal_summary_agent(document: str) -> str:
-    """Generate a document summary following Serbian legal standards."""
-    try:
-        doc_chunks = chunk_document(document)
-        summaries = []
-        for chunk in doc_chunks:
-            messages = create_messages(
-                """Vi ste ekspertni pravni AI asistent specijalizovani za srpsko pravo. Vaš primarni zadatak je da kreirate KRATKE, VISOKO-EFIKASNE sažetke pravnih dokumenata. Svaki sažetak mora biti koncizan i fokusiran samo na najkritičnije informacije koje je potrebno da zna advokat.
+def chunk_revision(document: str, request_type: str, revision: Revision) -> list[str]:
+    """Chunk a revised document along the chunks its previous version was analyzed with.
+
+    The chunks are also kept on the revision, so they can be stored for the next version.
+    """
+    size = CHUNK_TOKEN_TARGETS.get(request_type, DEFAULT_CHUNK_TOKENS)
+    if size not in revision.chunks:
+        previous = revision.previous_chunks.get(size) or chunk_document(revision.previous_text, request_type)
+        revision.chunks[size] = rechunk_text(document, previous, size, CHUNK_OVERLAP_TOKENS, MODEL_NAME)
+    return revision.chunks[size]
+
+def near_duplicates_for(request_type: str):
+    """The near-duplicate index when the request type's chunk notes may be reused, else None."""
+    return near_duplicates if request_type in NEAR_DUPLICATE_TYPES else None
+
+def estimate_tokens(messages) -> int:
+    """Tokens reserved from the tokens-per-minute budget: the prompt plus an expected completion."""
+    return sum(count_tokens(message.content) for message in messages) + EXPECTED_COMPLETION_TOKENS
+
+def record_usage(estimate: int, output: str, usage: dict):
+    """Settle the scheduler's token reservation and record tokens and cost, counting them locally if the backend reported none."""
+    prompt_tokens = usage.get("input_tokens") or estimate - EXPECTED_COMPLETION_TOKENS
+    completion_tokens = usage.get("output_tokens") or count_tokens(output)
+    scheduler.settle(estimate, prompt_tokens + completion_tokens)
+    metrics.record_llm_usage(get_model().model_name, prompt_tokens, completion_tokens)
+
+async def invoke_model(messages, priority: int = None) -> str:
+    """Invoke the model through the scheduler, serving repeated requests from the completion cache."""
+    model = get_model()
+    key = LLMCache.make_key(model.model_name, MODEL_TEMPERATURE, PROMPT_VERSION, messages)
+    # SQLite reads and commits stay off the event loop shared by concurrent chunks and streams
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    metrics.record_cache("llm", cached is not None)
+    if cached is not None:
+        return cached
+    estimate = estimate_tokens(messages)
+    with metrics.span("llm_call", {"mode": "invoke"}, model=model.model_name):
+        response = await scheduler.run(lambda: model.ainvoke(messages), estimate, priority)
+    record_usage(estimate, response.content, getattr(response, "usage_metadata", None) or {})
+    await asyncio.to_thread(llm_cache.put, key, response.content)
+    return response.content
+
+async def run_chunked_prompt(prompt: str, chunks: list[str], max_concurrency: int = None, checkpoint=None, stage: str = "map",
+                             near_duplicates: NearDuplicateIndex = None) -> list[str]:
+    """Run the prompt over all chunks concurrently and return the outputs in chunk order.
+
+    With a checkpoint (see src.job_store.JobCheckpoint), outputs saved for
+    this stage by an earlier, interrupted run are reused and new outputs
+    are saved as soon as each call completes. With a near-duplicate index,
+    chunks with the same words as previously analyzed ones reuse their
+    output, and template text with changed words is analyzed with the
+    stored output and the word differences in the prompt.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or MAX_CONCURRENCY)
+    return list(await asyncio.gather(*(
+        run_checkpointed(prompt, chunk, semaphore, checkpoint, stage, position, near_duplicates)
+        for position, chunk in enumerate(chunks)
+    )))
+
+async def run_checkpointed(prompt: str, chunk: str, semaphore: asyncio.Semaphore, checkpoint, stage: str, position: int,
+                           near_duplicates: NearDuplicateIndex = None) -> str:
+    # Checkpoint and near-duplicate reads and writes are blocking database calls, kept off the event loop
+    if checkpoint is not None:
+        saved = await asyncio.to_thread(checkpoint.get, stage, position, prompt, chunk)
+        metrics.record_cache("checkpoint", saved is not None)
+        if saved is not None:
+            return saved
+    scope = None
+    messages = create_messages(prompt, chunk)
+    if near_duplicates is not None:
+        scope = NearDuplicateIndex.make_scope(get_model().model_name, PROMPT_VERSION, prompt)
+        match = await asyncio.to_thread(near_duplicates.lookup, scope, chunk)
+        metrics.record_cache("near_duplicate", match is not None and match.exact)
+        if match is not None and match.exact:
+            if checkpoint is not None:
+                await asyncio.to_thread(checkpoint.put, stage, position, prompt, chunk, match.output)
+            return match.output
+        if match is not None:
+            messages = create_messages(prompt, template_text(chunk, match))
+    with metrics.span("chunk", {"stage": stage}, position=position, characters=len(chunk)):
+        async with semaphore:
+            output = await invoke_model(messages)
+    if checkpoint is not None:
+        await asyncio.to_thread(checkpoint.put, stage, position, prompt, chunk, output)
+    if scope is not None:
+        await asyncio.to_thread(near_duplicates.add, scope, chunk, output)
+    return output
+
+# Map stage: what each chunk's notes must capture for the final output
+NOTES_FOCUS = {
+    "summary": "stranke, sud, broj predmeta, ključne činjenice, pravna pitanja, argumente strana, odluku i rokove",
+    "appeal": "odluku koja se pobija, utvrđene činjenice, pravne i procesne greške, dokaze i osnove za žalbu",
+    "review": "vrstu dokumenta, strane, obaveze, probleme usklađenosti sa srpskim pravom i rizike",
+    "lawsuit": "stranke, činjenice, pravne osnove zahteva, štetu, iznose i dokaze",
+    "lawsuit_response": "tvrdnje tužioca, činjenice koje se mogu osporiti, pravne argumente odbrane i dokaze",
+    "contract_analysis": "strane, predmet, ključne klauzule sa brojevima članova, obaveze, rokove, iznose, nejasnoće i rizike",
+}
+
+NOTES_PROMPT = """Vi ste pravni analitičar specijalizovan za srpsko pravo. Dobijate jedan deo dužeg pravnog dokumenta.
+                Izvucite SAMO sažete beleške (maksimalno 200 reči) koje će kasnije biti spojene sa beleškama iz ostalih delova.
+                Fokusirajte se na: {focus}.
+                Navedite brojeve članova, datume i iznose tačno kako stoje u dokumentu. Ne pišite uvod ni zaključak.
+
+                Deo dokumenta:
+                {document}"""
+
+REDUCE_PROMPT = """Vi ste pravni analitičar specijalizovan za srpsko pravo. Dobijate beleške izvučene iz uzastopnih delova istog pravnog dokumenta.
+                Spojite ih u jedne sažete beleške (maksimalno 300 reči): uklonite ponavljanja, zadržite redosled, brojeve članova, datume i iznose.
+
+                Beleške:
+                {document}"""
+
+NOTES_SEPARATOR = "\n\n---\n\n"
+
+TEMPLATE_NOTE = """
+
+                NAPOMENA: Ovaj deo je šablonski tekst gotovo istovetan ranije analiziranom delu, ali se od njega razlikuje u rečima navedenim ispod.
+                Izmenjene reči mogu promeniti pravni smisao: analizirajte tekst iznad u celini i ne prenosite ništa iz ranije analize što za njega ne važi.
+
+                Razlike u odnosu na ranije analizirani deo (u zagradama):
+                {diff}
+
+                Analiza ranijeg dela:
+                {output}"""
+
+def template_text(chunk: str, match: NearDuplicate) -> str:
+    """The chunk followed by its word differences from similar analyzed text and that text's analysis."""
+    return chunk + TEMPLATE_NOTE.replace("{diff}", word_diff(match.text, chunk)).replace("{output}", match.output)
+
+async def map_reduce_document(prompt: str, chunks: list[str], request_type: str, fan_in: int = None, checkpoint=None,
+                              near_duplicates: bool = True) -> str:
+    """Produce a single output for a document of any length.
+
+    A single chunk goes straight to the final prompt. Longer documents are
+    mapped to compact notes in parallel, the notes are merged in groups of
+    fan_in until at most fan_in remain, and the final prompt runs once over
+    the merged notes. near_duplicates=False skips the near-duplicate index.
+    """
+    if not chunks:
+        return ""
+    if len(chunks) == 1:
+        return (await run_chunked_prompt(prompt, chunks, checkpoint=checkpoint, stage="final"))[0]
+    index = near_duplicates_for(request_type) if near_duplicates else None
+    notes = await run_chunked_prompt(notes_prompt_for(request_type), chunks, checkpoint=checkpoint, near_duplicates=index)
+    return await reduce_notes(prompt, notes, fan_in, checkpoint)
+
+def notes_prompt_for(request_type: str) -> str:
+    return NOTES_PROMPT.replace("{focus}", NOTES_FOCUS.get(request_type, NOTES_FOCUS["summary"]))
+
+async def reduce_notes(prompt: str, notes: list[str], fan_in: int = None, checkpoint=None) -> str:
+    """Merge notes in groups of fan_in until at most fan_in remain, then run the final prompt."""
+    notes = await merge_notes(notes, fan_in, checkpoint)
+    return (await run_chunked_prompt(prompt, [NOTES_SEPARATOR.join(notes)], checkpoint=checkpoint, stage="final"))[0]
+
+async def merge_notes(notes: list[str], fan_in: int = None, checkpoint=None) -> list[str]:
+    fan_in = max(fan_in or REDUCE_FAN_IN, 2)
+    level = 0
+    while len(notes) > fan_in:
+        level += 1
+        groups = [NOTES_SEPARATOR.join(notes[i:i + fan_in]) for i in range(0, len(notes), fan_in)]
+        notes = await run_chunked_prompt(REDUCE_PROMPT, groups, checkpoint=checkpoint, stage=f"reduce{level}")
+    return notes
+
+async def stream_model(messages, priority: int = None):
+    """Stream the model's answer as text deltas; cached answers are yielded whole."""
+    model = get_model()
+    key = LLMCache.make_key(model.model_name, MODEL_TEMPERATURE, PROMPT_VERSION, messages)
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    metrics.record_cache("llm", cached is not None)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    usage = {}
+    estimate = estimate_tokens(messages)
+    with metrics.span("llm_call", {"mode": "stream"}, model=model.model_name):
+        async for chunk in scheduler.stream(lambda: model.astream(messages), estimate, priority):
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+    record_usage(estimate, "".join(parts), usage)
+    await asyncio.to_thread(llm_cache.put, key, "".join(parts))
+
+async def stream_document_agent(document: str, request_type: str, fan_in: int = None, checkpoint=None, revision: Revision = None):
+    """Stream a chunked agent's work as ("progress", message) and ("text", delta) events.
+
+    For multi-chunk documents a progress event is emitted as each chunk's
+    notes arrive and when notes are merged; the final output is then
+    streamed token by token. For a revision, the changes are listed first
+    and only chunks not analyzed in the previous version reach the model.
+    """
+    prompt = AGENT_PROMPTS[request_type]
+    if revision is not None:
+        prompt = revision_prompt(prompt, revision)
+        chunks = chunk_revision(document, request_type, revision)
+        yield "text", render_changes(revision)
+    else:
+        chunks = chunk_document(document, request_type)
+    if not chunks:
+        return
+    if len(chunks) > 1:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        notes_prompt = notes_prompt_for(request_type)
+        # A revision's changed clauses would match their own previous version there
+        index = near_duplicates_for(request_type) if revision is None else None
+
+        async def notes_for(position: int, chunk: str) -> tuple[int, str]:
+            return position, await run_checkpointed(notes_prompt, chunk, semaphore, checkpoint, "map", position, index)
+
+        notes = [None] * len(chunks)
+        for done, task in enumerate(asyncio.as_completed([notes_for(i, chunk) for i, chunk in enumerate(chunks)]), start=1):
+            position, text = await task
+            notes[position] = text
+            yield "progress", f"Analyzed part {done} of {len(chunks)}"
+        if len(notes) > max(fan_in or REDUCE_FAN_IN, 2):
+            yield "progress", f"Merging notes from {len(notes)} parts"
+            notes = await merge_notes(notes, fan_in, checkpoint)
+        chunks = [NOTES_SEPARATOR.join(notes)]
+    saved = await asyncio.to_thread(checkpoint.get, "final", 0, prompt, chunks[0]) if checkpoint is not None else None
+    if saved is not None:
+        yield "text", saved
+        return
+    parts = []
+    async for delta in stream_model(create_messages(prompt, chunks[0])):
+        parts.append(delta)
+        yield "text", delta
+    if checkpoint is not None:
+        await asyncio.to_thread(checkpoint.put, "final", 0, prompt, chunks[0], "".join(parts))
+
+async def stream_chat_helper_agent(document: str, question: str = "", index: PassageIndex = None):
+    """Streaming variant of legal_chat_helper_agent, yielding ("text", delta) events."""
+    async for delta in stream_model(create_chat_messages(document, question, index), INTERACTIVE):
+        yield "text", delta
+
+SUMMARY_PROMPT = """Vi ste ekspertni pravni AI asistent specijalizovani za srpsko pravo. Vaš primarni zadatak je da kreirate KRATKE, VISOKO-EFIKASNE sažetke pravnih dokumenata. Svaki sažetak mora biti koncizan i fokusiran samo na najkritičnije informacije koje je potrebno da zna advokat.
 
                 OSNOVNI ZAHTEVI:
                 
@@ -84,24 +372,9 @@ async def legal_summary_agent(document: str) -> str:
                 Istaknite samo vremenski kritične elemente
 
                 Molimo vas da dostavite kratak sažetak sledećeg dokumenta, striktno pridržavajući se navedenih zahteva u pogledu dužine i formata:
-                {document}""",
-                chunk
-            )
-            response = model.invoke(messages)
-            summaries.append(response.content)
-        return " ".join(summaries)
-    except Exception as e:
-        logging.error(f"Error in summary agent: {e}")
-        return f"Error generating summary: {str(e)}"
+                {document}"""
 
-async def legal_appeal_agent(document: str) -> str:
-    """Generate a formal appeal based on Serbian legal standards."""
-    try:
-        doc_chunks = chunk_document(document)
-        appeal_parts = []
-        for chunk in doc_chunks:
-            messages = create_messages(
-                """Vi ste pravni pomoćnik specijalizovan za sastavljanje formalnih žalbi na osnovu dostavljenog pravnog dokumenta.
+APPEAL_PROMPT = """Vi ste pravni pomoćnik specijalizovan za sastavljanje formalnih žalbi na osnovu dostavljenog pravnog dokumenta.
                 Analizirajte dokument i generišite žalbu prema sledećoj strukturi:
 
                 1. Zaglavlje
@@ -137,24 +410,9 @@ async def legal_appeal_agent(document: str) -> str:
                 [Potvrda o dostavljanju]
 
                 Analizirajte sledeći dokument i popunite strukturu:
-                {document}""",
-                chunk
-            )
-            response = model.invoke(messages)
-            appeal_parts.append(response.content)
-        return " ".join(appeal_parts)
-    except Exception as e:
-        logging.error(f"Error in appeal agent: {e}")
-        return f"Error generating appeal: {str(e)}"
+                {document}"""
 
-async def legal_review_agent(document: str) -> str:
-    """Generate a comprehensive legal review following Serbian legal standards."""
-    try:
-        doc_chunks = chunk_document(document)
-        reviews = []
-        for chunk in doc_chunks:
-            messages = create_messages(
-                """Vi ste ekspert za srpsko pravo, veštački inteligentni analitičar sa dubokim znanjem o srpskom ugovornom, privrednom i građanskom pravu.  
+REVIEW_PROMPT = """Vi ste ekspert za srpsko pravo, veštački inteligentni analitičar sa dubokim znanjem o srpskom ugovornom, privrednom i građanskom pravu.  
                 Ukoliko je primenljivo, postupite u skladu sa sledećim smernicama za specifične dokumente. Izradite fokusiran pregled pravnog dokumenta (maksimum 750 reči), pokušajte da generišete mogući koncizan pregled na osnovu koga srpski advokati mogu odmah da preduzmu radnje:
 
                 *SAŽETAK ZA IZVRŠENJE* (3-4 rečenice maksimalno)  
@@ -200,24 +458,9 @@ async def legal_review_agent(document: str) -> str:
                 - Istaknuti sve hitne probleme usklađenosti  
 
                 Analizirajte sledeći dokument u skladu sa ovim parametrima:
-                {document}""",
-                chunk
-            )
-            response = model.invoke(messages)
-            reviews.append(response.content)
-        return " ".join(reviews)
-    except Exception as e:
-        logging.error(f"Error in review agent: {e}")
-        return f"Error generating review: {str(e)}"
+                {document}"""
 
-async def legal_lawsuit_agent(document: str) -> str:
-    """Generate a formal lawsuit based on the legal document analysis following Serbian legal standards."""
-    try:
-        doc_chunks = chunk_document(document)
-        lawsuit_parts = []
-        for chunk in doc_chunks:
-            messages = create_messages(
-                """Vi ste AI asistent dizajniran da pomognete srpskim advokatima u sastavljanju pravnih tužbi i srodnih dokumenata.
+LAWSUIT_PROMPT = """Vi ste AI asistent dizajniran da pomognete srpskim advokatima u sastavljanju pravnih tužbi i srodnih dokumenata.
                 Analizirajte dokument i generišite pravnu tužbu prema sledećoj strukturi:
 
                 [Naziv suda]
@@ -257,24 +500,9 @@ async def legal_lawsuit_agent(document: str) -> str:
                 [Navesti dokaze]
 
                 Analizirajte sledeći dokument i popunite strukturu:
-                {document}""",
-                chunk
-            )
-            response = model.invoke(messages)
-            lawsuit_parts.append(response.content)
-        return " ".join(lawsuit_parts)
-    except Exception as e:
-        logging.error(f"Error in lawsuit agent: {e}")
-        return f"Error generating lawsuit: {str(e)}"
+                {document}"""
 
-async def legal_lawsuit_response_agent(document: str) -> str:
-    """Generate a formal response to a lawsuit based on Serbian legal standards."""
-    try:
-        doc_chunks = chunk_document(document)
-        response_parts = []
-        for chunk in doc_chunks:
-            messages = create_messages(
-                """Vi ste AI asistent dizajniran da pomognete srpskim advokatima u pripremanju pravnih odgovora na tužbe.
+LAWSUIT_RESPONSE_PROMPT = """Vi ste AI asistent dizajniran da pomognete srpskim advokatima u pripremanju pravnih odgovora na tužbe.
                 Analizirajte dokument i generišite odgovor na tužbu prema sledećoj strukturi:
 
                 [Naziv suda]
@@ -307,24 +535,9 @@ async def legal_lawsuit_response_agent(document: str) -> str:
                 [Navesti dokaze]
 
                 Analizirajte sledeći dokument i popunite strukturu:
-                {document}""",
-                chunk
-            )
-            response = model.invoke(messages)
-            response_parts.append(response.content)
-        return " ".join(response_parts)
-    except Exception as e:
-        logging.error(f"Error in lawsuit response agent: {e}")
-        return f"Error generating lawsuit response: {str(e)}"
+                {document}"""
 
-async def legal_contract_analysis_agent(document: str) -> str:
-    """Analyze legal contracts following Serbian legal standards."""
-    try:
-        doc_chunks = chunk_document(document)
-        analysis_parts = []
-        for chunk in doc_chunks:
-            messages = create_messages(
-                """Vi ste AI analitičar pravnih ugovora specijalizovan za srpsko pravo.
+CONTRACT_ANALYSIS_PROMPT = """Vi ste AI analitičar pravnih ugovora specijalizovan za srpsko pravo.
                 Molimo vas da analizirate sledeći ugovor prema ovim kriterijumima:
 
                 1. Osnovni elementi ugovora:
@@ -364,57 +577,155 @@ async def legal_contract_analysis_agent(document: str) -> str:
                    - Pravna optimizacija
 
                 Analizirajte sledeći ugovor:
-                {document}""",
-                chunk
-            )
-            response = model.invoke(messages)
-            analysis_parts.append(response.content)
-        return " ".join(analysis_parts)
+                {document}"""
+
+REVISION_INSTRUCTIONS = """Ovo je nova verzija dokumenta koji je ranije već analiziran. Izmene u odnosu na prethodnu verziju:
+                {changes}
+
+                U analizi posebno istaknite ove izmene i njihov pravni značaj.
+
+                """
+
+def revision_prompt(prompt: str, revision: Revision) -> str:
+    """The final prompt with the list of changes inserted before the document."""
+    changes = changes_for_prompt(revision).replace("{", "{{").replace("}", "}}")
+    head, tail = prompt.rsplit("{document}", 1)
+    return head + REVISION_INSTRUCTIONS.replace("{changes}", changes) + "{document}" + tail
+
+# Final-stage prompt for each chunked request type
+AGENT_PROMPTS = {
+    "summary": SUMMARY_PROMPT,
+    "appeal": APPEAL_PROMPT,
+    "review": REVIEW_PROMPT,
+    "lawsuit": LAWSUIT_PROMPT,
+    "lawsuit_response": LAWSUIT_RESPONSE_PROMPT,
+    "contract_analysis": CONTRACT_ANALYSIS_PROMPT,
+}
+
+async def legal_summary_agent(document: str) -> str:
+    """Generate a document summary following Serbian legal standards."""
+    try:
+        doc_chunks = chunk_document(document, "summary")
+        return await map_reduce_document(SUMMARY_PROMPT, doc_chunks, "summary")
     except Exception as e:
-        logging.error(f"Error in contract analysis agent: {e}")
-        return f"Error analyzing contract: {str(e)}"
+        logging.error(f"Error in summary agent: {e}")
+        raise
 
-async def legal_chat_helper_agent(document: str, question: str = "") -> str:
-    """Interactive chat agent for answering questions about legal documents."""
+async def legal_appeal_agent(document: str) -> str:
+    """Generate a formal appeal based on Serbian legal standards."""
     try:
-        system_message = SystemMessage(content="""
-            You are the "Legal Chat Helper Agent," designed to assist users in managing and interacting with documents.
-            Your role is to:
-            - Guide users through document interactions
-            - Provide explanations in clear, layman's terms
-            - Help with understanding specific parts of documents
-            - Suggest relevant document actions (summary, appeal, review, etc.)
-            - Remain neutral and professional
-            - Ensure accurate and helpful responses
-            
-            When responding:
-            1. First understand if the user needs:
-               - Explanation of document content
-               - Help with document modifications
-               - Guidance on using other agents
-               - General legal document questions
-            2. Provide clear, structured responses
-            3. Suggest relevant next steps or actions
-            4. Always base responses on the provided document content
-        """)
+        doc_chunks = chunk_document(document, "appeal")
+        return await map_reduce_document(APPEAL_PROMPT, doc_chunks, "appeal")
+    except Exception as e:
+        logging.error(f"Error in appeal agent: {e}")
+        raise
+
+async def legal_review_agent(document: str) -> str:
+    """Generate a comprehensive legal review following Serbian legal standards."""
+    try:
+        doc_chunks = chunk_document(document, "review")
+        return await map_reduce_document(REVIEW_PROMPT, doc_chunks, "review")
+    except Exception as e:
+        logging.error(f"Error in review agent: {e}")
+        raise
+
+async def legal_lawsuit_agent(document: str) -> str:
+    """Generate a formal lawsuit based on the legal document analysis following Serbian legal standards."""
+    try:
+        doc_chunks = chunk_document(document, "lawsuit")
+        return await map_reduce_document(LAWSUIT_PROMPT, doc_chunks, "lawsuit")
+    except Exception as e:
+        logging.error(f"Error in lawsuit agent: {e}")
+        raise
+
+async def legal_lawsuit_response_agent(document: str) -> str:
+    """Generate a formal response to a lawsuit based on Serbian legal standards."""
+    try:
+        doc_chunks = chunk_document(document, "lawsuit_response")
+        return await map_reduce_document(LAWSUIT_RESPONSE_PROMPT, doc_chunks, "lawsuit_response")
+    except Exception as e:
+        logging.error(f"Error in lawsuit response agent: {e}")
+        raise
+
+async def legal_contract_analysis_agent(document: str) -> str:
+    """Analyze legal contracts following Serbian legal standards."""
+    try:
+        doc_chunks = chunk_document(document, "contract_analysis")
+        return await map_reduce_document(CONTRACT_ANALYSIS_PROMPT, doc_chunks, "contract_analysis")
+    except Exception as e:
+        logging.error(f"Error in contract analysis agent: {e}")
+        raise
+
+async def legal_document_agent(document: str, request_type: str, checkpoint=None, chunks: list[str] = None, revision: Revision = None) -> str:
+    """Run any chunked agent by request type, optionally checkpointing every LLM call.
+
+    Pass precomputed chunks (see chunk_document_for_actions) to skip chunking.
+    For a revision the output starts with the list of changes.
+    """
+    if revision is None:
+        doc_chunks = chunk_document(document, request_type) if chunks is None else chunks
+        return await map_reduce_document(AGENT_PROMPTS[request_type], doc_chunks, request_type, checkpoint=checkpoint)
+    doc_chunks = chunk_revision(document, request_type, revision) if chunks is None else chunks
+    prompt = revision_prompt(AGENT_PROMPTS[request_type], revision)
+    # Changed clauses must reach the model, not match their previous version in the near-duplicate index
+    analysis = await map_reduce_document(prompt, doc_chunks, request_type, checkpoint=checkpoint, near_duplicates=False)
+    return render_changes(revision) + analysis
+
+def create_chat_messages(document: str, question: str = "", index: PassageIndex = None):
+    """Build chat messages from the CHAT_TOP_K passages most relevant to the question."""
+    if index is None:
+        index = PassageIndex.from_pages([document], embedder=get_embedder())
+    # Fall back to the opening passages when nothing matches the question lexically
+    relevant = index.search(question, k=CHAT_TOP_K) or index.passages[:CHAT_TOP_K]
+    passages = "\n\n".join(f"[Page {passage.page}]\n{passage.text}" for passage in relevant)
+    system_message = SystemMessage(content="""
+        You are the "Legal Chat Helper Agent," designed to assist users in managing and interacting with documents.
+        Your role is to:
+        - Guide users through document interactions
+        - Provide explanations in clear, layman's terms
+        - Help with understanding specific parts of documents
+        - Suggest relevant document actions (summary, appeal, review, etc.)
+        - Remain neutral and professional
+        - Ensure accurate and helpful responses
+        
+        When responding:
+        1. First understand if the user needs:
+           - Explanation of document content
+           - Help with document modifications
+           - Guidance on using other agents
+           - General legal document questions
+        2. Provide clear, structured responses
+        3. Suggest relevant next steps or actions
+        4. Always base responses on the provided document passages and cite their page numbers
+    """)
+    
+    human_message = HumanMessage(content=f"""
+        Based on this legal document, please help with the following:
         
-        human_message = HumanMessage(content=f"""
-            Based on this legal document, please help with the following:
-            
-            User Question: {question}
-            
-            Document Content:
-            ---
-            {document}
-            ---
-            
-            Please provide a helpful and detailed response while maintaining professional legal context.
-        """)
+        User Question: {question}
         
-        messages = [system_message, human_message]
-        response = model.invoke(messages)
-        return response.content
+        Relevant Document Passages:
+        ---
+        {passages}
+        ---
+        
+        Please provide a helpful and detailed response while maintaining professional legal context.
+    """)
+    
+    messages = [system_message, human_message]
+    return messages
+
+async def legal_chat_helper_agent(document: str, question: str = "", index: PassageIndex = None) -> str:
+    """Interactive chat agent for answering questions about legal documents.
+
+    Only the CHAT_TOP_K passages most relevant to the question are sent to
+    the model. Pass the document's prebuilt index to avoid reindexing it on
+    every question.
+    """
+    try:
+        messages = create_chat_messages(document, question, index)
+        return await invoke_model(messages, INTERACTIVE)
     except Exception as e:
         logging.error(f"Error in chat helper: {e}")
-        return "I apologize, but I encountered an error. Could you please rephrase your question or specify what you'd like to know about the document?"
+        raise
 
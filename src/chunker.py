@@ -0,0 +1,167 @@
+import re
+import logging
+from functools import lru_cache
+import tiktoken
+
+# Encoding used when tiktoken does not know the model name
+DEFAULT_ENCODING = "o200k_base"
+
+# Lines that open a new article or section in Serbian legal texts (Latin and Cyrillic)
+ARTICLE_PATTERN = re.compile(
+    r"^\s*(član|clan|члан|glava|глава|odeljak|одељак)\s+\d+",
+    re.IGNORECASE | re.MULTILINE
+)
+# Fraction of the budget after which a chunk is closed at the next article heading
+ARTICLE_BREAK_FILL = 0.85
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?;:])\s+(?=[A-ZČĆŠŽĐА-ЯЂЈЉЊЋЏ0-9\"„(])")
+
+class ApproximateEncoding:
+    """Offline stand-in for a tiktoken encoding (roughly one token per four characters of a word)."""
+
+    PIECE_PATTERN = re.compile(r"\s*(?:\w{1,4}|[^\w\s])|\s+")
+
+    def encode(self, text: str, disallowed_special=()) -> list[str]:
+        return self.PIECE_PATTERN.findall(text)
+
+    def decode(self, pieces: list[str]) -> str:
+        return "".join(pieces)
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = None):
+    """Return the tiktoken encoding for a model, falling back to the default encoding."""
+    try:
+        if model_name:
+            try:
+                return tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; without network access
+        # fall back to an approximate count instead of failing the request
+        logging.warning(f"Could not load tiktoken encoding, using approximate token counts: {e}")
+        return ApproximateEncoding()
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+def split_sections(text: str) -> list[str]:
+    """Split text before every article/section heading."""
+    starts = [m.start() for m in ARTICLE_PATTERN.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    return [text[a:b] for a, b in zip(starts, starts[1:]) if text[a:b].strip()]
+
+def _split_units(text: str, max_tokens: int, encoding) -> list[tuple[str, int, bool]]:
+    """Break text into (unit, tokens, starts_article) pieces no larger than max_tokens.
+
+    Pieces follow the most natural boundary that fits: article, paragraph,
+    sentence and, as a last resort, a hard cut on token boundaries.
+    """
+    units = []
+    for section in split_sections(text):
+        starts_article = bool(ARTICLE_PATTERN.match(section))
+        for paragraph in PARAGRAPH_PATTERN.split(section):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            tokens = len(encoding.encode(paragraph, disallowed_special=()))
+            if tokens <= max_tokens:
+                units.append((paragraph, tokens, starts_article))
+                starts_article = False
+                continue
+            for sentence in SENTENCE_PATTERN.split(paragraph):
+                encoded = encoding.encode(sentence, disallowed_special=())
+                for start in range(0, len(encoded), max_tokens):
+                    piece = encoded[start:start + max_tokens]
+                    units.append((encoding.decode(piece), len(piece), starts_article))
+                    starts_article = False
+    return units
+
+def chunk_text(text: str, max_tokens: int = 8000, overlap_tokens: int = 0, model_name: str = None) -> list[str]:
+    """Pack text into chunks of at most max_tokens tokens along structural boundaries.
+
+    A chunk is closed early at an article heading once it is mostly full
+    (ARTICLE_BREAK_FILL), so articles are kept together whenever they fit. With
+    overlap_tokens, the trailing units of each chunk are repeated at the
+    start of the next one.
+    """
+    if not text.strip():
+        return []
+    encoding = get_encoding(model_name)
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        chunks.append("\n\n".join(unit for unit, _ in current))
+        carried, carried_tokens = [], 0
+        for unit, tokens in reversed(current):
+            if carried_tokens + tokens > overlap_tokens:
+                break
+            carried.insert(0, (unit, tokens))
+            carried_tokens += tokens
+        current, current_tokens = carried, carried_tokens
+        return len(carried)
+
+    carried_count = 0
+    for unit, tokens, starts_article in _split_units(text, max_tokens, encoding):
+        fresh_tokens = current_tokens - sum(t for _, t in current[:carried_count])
+        if current_tokens + tokens > max_tokens or (starts_article and fresh_tokens >= max_tokens * ARTICLE_BREAK_FILL):
+            if len(current) > carried_count:
+                carried_count = flush()
+            while current and current_tokens + tokens > max_tokens:
+                current_tokens -= current.pop(0)[1]
+                carried_count = max(carried_count - 1, 0)
+        current.append((unit, tokens))
+        current_tokens += tokens
+    if len(current) > carried_count:
+        chunks.append("\n\n".join(unit for unit, _ in current))
+    return chunks
+
+def rechunk_text(text: str, previous_chunks: list[str], max_tokens: int = 8000, overlap_tokens: int = 0, model_name: str = None) -> list[str]:
+    """Chunk a revised text so that chunks unchanged since the previous version come out identical.
+
+    Every previous chunk whose units still appear in order in the new text
+    is kept as it was; only the units around edits are packed into new
+    chunks with chunk_text(). An edit therefore changes the chunks it
+    touches instead of shifting every boundary after it.
+    """
+    if not text.strip():
+        return []
+    encoding = get_encoding(model_name)
+    units = [unit for unit, _, _ in _split_units(text, max_tokens, encoding)]
+    starts = {}
+    for position, unit in enumerate(units):
+        starts.setdefault(unit, []).append(position)
+
+    anchors = []  # (start, stop, chunk) of previous chunks found in the new text
+    earliest = 0
+    for chunk in previous_chunks:
+        pieces = chunk.split("\n\n")
+        for start in starts.get(pieces[0], []):
+            if start >= earliest and units[start:start + len(pieces)] == pieces:
+                anchors.append((start, start + len(pieces), chunk))
+                # Overlapping chunks share their boundary units
+                earliest = start + 1
+                break
+
+    covered = [False] * len(units)
+    for start, stop, _ in anchors:
+        covered[start:stop] = [True] * (stop - start)
+    # Runs of units not covered by any kept chunk are chunked afresh
+    parts = [(start, [chunk]) for start, _, chunk in anchors]
+    position = 0
+    while position < len(units):
+        if covered[position]:
+            position += 1
+            continue
+        stop = position
+        while stop < len(units) and not covered[stop]:
+            stop += 1
+        parts.append((position, chunk_text("\n\n".join(units[position:stop]), max_tokens, overlap_tokens, model_name)))
+        position = stop
+    return [chunk for _, part in sorted(parts, key=lambda part: part[0]) for chunk in part]
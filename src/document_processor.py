@@ -1,4 +1,6 @@
+import asyncio
 import logging
+from src import metrics
 from src.agents import (
     legal_summary_agent,
     legal_appeal_agent,
@@ -6,13 +8,29 @@ from src.agents import (
     legal_lawsuit_agent,
     legal_lawsuit_response_agent,
     legal_contract_analysis_agent,
-    legal_chat_helper_agent
+    legal_chat_helper_agent,
+    legal_document_agent,
+    chunk_document_for_actions,
+    chunk_revision,
+    stream_document_agent,
+    stream_chat_helper_agent,
+    AGENT_PROMPTS
 )
 
 class LegalDocumentProcessor:
-    async def process_document(self, document: str, request_type: str, question: str = None) -> dict:
+    async def process_document(self, document: str, request_type: str, question: str = None, index=None, checkpoint=None, revision=None) -> dict:
+        with metrics.track_request(request_type) as stats:
+            result = await self._process_document(document, request_type, question, index, checkpoint, revision)
+            if "error" in result:
+                stats.status = "error"
+            return result
+
+    async def _process_document(self, document: str, request_type: str, question: str = None, index=None, checkpoint=None, revision=None) -> dict:
         try:
-            if request_type == "summary":
+            if (checkpoint is not None or revision is not None) and request_type in AGENT_PROMPTS:
+                # Resumable run: every finished LLM call is saved to the job's checkpoint
+                result = await legal_document_agent(document, request_type, checkpoint, revision=revision)
+            elif request_type == "summary":
                 result = await legal_summary_agent(document)
             elif request_type == "appeal":
                 result = await legal_appeal_agent(document)
@@ -25,10 +43,62 @@ class LegalDocumentProcessor:
             elif request_type == "contract_analysis":
                 result = await legal_contract_analysis_agent(document)
             elif request_type == "chat":
-                result = await legal_chat_helper_agent(document, question)
+                result = await legal_chat_helper_agent(document, question, index)
             else:
                 return {"error": "Invalid request type"}
 
             return {"result": result}
         except Exception as e:
             return {"error": str(e)}
+
+    async def process_actions(self, document: str, request_types, checkpoints: dict = None, revision=None):
+        """Run several chunked request types over one document, yielding (request_type, result) as each finishes.
+
+        The document is chunked once per distinct chunk size and all agents
+        run concurrently through the shared model scheduler, so the total
+        time is close to that of the slowest action. checkpoints optionally
+        maps request types to job checkpoints. With a revision (see
+        JobStore.revision), the document is chunked along its previous
+        version and the results start with the list of changes.
+        """
+        request_types = list(dict.fromkeys(request_types))
+        for request_type in request_types:
+            if request_type not in AGENT_PROMPTS:
+                yield request_type, {"error": "Invalid request type"}
+        valid = [request_type for request_type in request_types if request_type in AGENT_PROMPTS]
+        if not valid:
+            return
+        if revision is None:
+            chunks = await asyncio.to_thread(chunk_document_for_actions, document, valid)
+        else:
+            chunks = {request_type: await asyncio.to_thread(chunk_revision, document, request_type, revision) for request_type in valid}
+
+        async def run(request_type: str) -> tuple[str, dict]:
+            checkpoint = (checkpoints or {}).get(request_type)
+            with metrics.track_request(request_type) as stats:
+                try:
+                    result = await legal_document_agent(document, request_type, checkpoint, chunks[request_type], revision)
+                    return request_type, {"result": result}
+                except Exception as e:
+                    stats.status = "error"
+                    return request_type, {"error": str(e)}
+
+        tasks = [asyncio.create_task(run(request_type)) for request_type in valid]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # The consumer stopped early; do not leave agents running
+            for task in tasks:
+                task.cancel()
+
+    async def stream_document(self, document: str, request_type: str, question: str = None, index=None, checkpoint=None, revision=None):
+        """Stream processing events: ("progress", message) while chunks are analyzed, then ("text", delta) for the output."""
+        if request_type == "chat":
+            events = stream_chat_helper_agent(document, question, index)
+        elif request_type in AGENT_PROMPTS:
+            events = stream_document_agent(document, request_type, checkpoint=checkpoint, revision=revision)
+        else:
+            raise ValueError("Invalid request type")
+        async for event in metrics.track_request_events(request_type, events):
+            yield event
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+class ExtractionCache:
+    """Persistent cache of per-page PDF extraction results, stored in SQLite.
+
+    Documents are keyed by a SHA-256 of the PDF bytes and the OCR settings,
+    so a re-upload of the same file skips both parsing and OCR.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, page_count INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT NOT NULL, page_number INTEGER NOT NULL, text TEXT NOT NULL, source TEXT NOT NULL, "
+            "triage TEXT NOT NULL DEFAULT '', PRIMARY KEY (key, page_number))"
+        )
+        try:
+            # Caches created before page triage was recorded
+            self._conn.execute("ALTER TABLE pages ADD COLUMN triage TEXT NOT NULL DEFAULT ''")
+        except sqlite3.OperationalError:
+            pass
+        self._conn.commit()
+
+    @staticmethod
+    def content_hash(pdf) -> str:
+        """SHA-256 of the PDF contents (a file path, or the bytes themselves)."""
+        digest = hashlib.sha256()
+        if isinstance(pdf, (str, os.PathLike)):
+            with open(pdf, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        else:
+            digest.update(pdf)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, settings: str) -> str:
+        """Combine the PDF's content hash with the extraction settings."""
+        return hashlib.sha256(f"{content_hash};{settings}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return [(page_number, text, source, triage), ...] for a cached document, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM documents WHERE key = ?", (key,)).fetchone() is None:
+                self.misses += 1
+                return None
+            rows = self._conn.execute(
+                "SELECT page_number, text, source, triage FROM pages WHERE key = ? ORDER BY page_number", (key,)
+            ).fetchall()
+            self.hits += 1
+            return rows
+
+    def put(self, key: str, rows):
+        """Store [(page_number, text, source, triage), ...] for a document."""
+        if not self.enabled:
+            return
+        rows = list(rows)
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO pages (key, page_number, text, source, triage) VALUES (?, ?, ?, ?, ?)",
+                [(key, page_number, text, source, triage) for page_number, text, source, triage in rows]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (key, page_count, created) VALUES (?, ?, ?)",
+                (key, len(rows), time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+            self._conn.commit()
+
+def extraction_cache_from_env() -> ExtractionCache:
+    """Build the cache from EXTRACTION_CACHE_* environment variables."""
+    try:
+        return ExtractionCache(
+            os.getenv("EXTRACTION_CACHE_PATH", os.path.join(".cache", "extraction_cache.sqlite")),
+            enabled=os.getenv("EXTRACTION_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+        )
+    except Exception as e:
+        logging.warning(f"Extraction cache unavailable, falling back to in-memory cache: {e}")
+        return ExtractionCache(":memory:")
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+from sqlalchemy import Float, ForeignKey, Integer, String, Text, create_engine, inspect, select, text, update
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from src.revisions import Revision, diff_documents
+
+# A running job whose worker has not saved progress for this long is considered crashed
+DEFAULT_LEASE_SECONDS = 600
+
+class Base(DeclarativeBase):
+    pass
+
+class JobRecord(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    document_hash: Mapped[str] = mapped_column(String(64), index=True)
+    document: Mapped[str] = mapped_column(Text)
+    request_type: Mapped[str] = mapped_column(String(32))
+    question: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Document version analyzed; when it revises an earlier version the job runs incrementally
+    version_id: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), index=True, default="pending")  # pending, running, done, failed
+    result: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    worker: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    created: Mapped[float] = mapped_column(Float)
+    updated: Mapped[float] = mapped_column(Float)
+
+class ChunkResult(Base):
+    __tablename__ = "chunk_results"
+
+    job_id: Mapped[str] = mapped_column(ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True)
+    stage: Mapped[str] = mapped_column(String(16), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+    input_hash: Mapped[str] = mapped_column(String(64), index=True)
+    output: Mapped[str] = mapped_column(Text)
+
+class DocumentVersion(Base):
+    __tablename__ = "document_versions"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    lineage: Mapped[str] = mapped_column(String(32), index=True)  # id of the first version
+    previous_id: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    number: Mapped[int] = mapped_column(Integer)
+    name: Mapped[str] = mapped_column(String(256))
+    document_hash: Mapped[str] = mapped_column(String(64))
+    document: Mapped[str] = mapped_column(Text)
+    created: Mapped[float] = mapped_column(Float)
+
+class DocumentChunks(Base):
+    """Chunks a document was analyzed with, so its next version can be chunked along them."""
+    __tablename__ = "document_chunks"
+
+    document_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    chunk_tokens: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chunks: Mapped[str] = mapped_column(Text)  # JSON list
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class JobCheckpoint:
+    """Per-job store of finished LLM calls, passed to the agents as checkpoint=.
+
+    Outputs are keyed by stage ("map", "reduce1", ..., "final") and chunk
+    position, and only reused when the prompt and chunk text are unchanged.
+    For a revised document, outputs of the same request on the previous
+    version are reused for an identical prompt and chunk text at any position.
+    """
+
+    def __init__(self, store: "JobStore", job_id: str, previous_document_hash: str = None, request_type: str = None):
+        self.store = store
+        self.job_id = job_id
+        self.previous_document_hash = previous_document_hash
+        self.request_type = request_type
+
+    def get(self, stage: str, position: int, prompt: str, text: str) -> Optional[str]:
+        input_hash = text_hash(prompt + text)
+        with Session(self.store.engine) as session:
+            row = session.get(ChunkResult, (self.job_id, stage, position))
+            if row is not None and row.input_hash == input_hash:
+                return row.output
+            if self.previous_document_hash is None:
+                return None
+            output = session.scalars(
+                select(ChunkResult.output)
+                .join(JobRecord, JobRecord.id == ChunkResult.job_id)
+                .where(
+                    JobRecord.document_hash == self.previous_document_hash,
+                    JobRecord.request_type == self.request_type,
+                    ChunkResult.stage == stage,
+                    ChunkResult.input_hash == input_hash
+                )
+                .limit(1)
+            ).first()
+        if output is not None:
+            # Copied into this job, so the next version finds it here
+            self.put(stage, position, prompt, text, output)
+        return output
+
+    def put(self, stage: str, position: int, prompt: str, text: str, output: str):
+        with Session(self.store.engine) as session, session.begin():
+            session.merge(ChunkResult(
+                job_id=self.job_id, stage=stage, position=position,
+                input_hash=text_hash(prompt + text), output=output
+            ))
+            # Saving progress also renews the job's lease
+            session.execute(update(JobRecord).where(JobRecord.id == self.job_id).values(updated=time.time()))
+
+class JobStore:
+    """Durable document/request jobs with chunk-level checkpoints (SQLite via SQLAlchemy by default)."""
+
+    def __init__(self, url: str = None, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        if url is None:
+            path = os.getenv("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite"))
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            url = f"sqlite:///{path}"
+        self.engine = create_engine(url)
+        self.lease_seconds = lease_seconds
+        Base.metadata.create_all(self.engine)
+        if "version_id" not in {column["name"] for column in inspect(self.engine).get_columns("jobs")}:
+            # Stores created before jobs recorded their document version
+            with self.engine.begin() as connection:
+                connection.execute(text("ALTER TABLE jobs ADD COLUMN version_id VARCHAR(32)"))
+
+    def create_job(self, document: str, request_type: str, question: str = None, version_id: str = None) -> str:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with Session(self.engine) as session, session.begin():
+            session.add(JobRecord(
+                id=job_id, document_hash=text_hash(document), document=document,
+                request_type=request_type, question=question, version_id=version_id, status="pending",
+                attempts=0, created=now, updated=now
+            ))
+        return job_id
+
+    def open_job(self, document: str, request_type: str, question: str = None, version_id: str = None) -> str:
+        """Return the unfinished job for this document and request, creating one if there is none.
+
+        version_id is the DocumentVersion being analyzed (see add_version); it
+        lets a worker resume a revision job incrementally.
+        """
+        with Session(self.engine) as session:
+            job_id = session.scalars(
+                select(JobRecord.id)
+                .where(
+                    JobRecord.document_hash == text_hash(document),
+                    JobRecord.request_type == request_type,
+                    JobRecord.question.is_(None) if question is None else JobRecord.question == question,
+                    JobRecord.status.in_(("pending", "running", "failed"))
+                )
+                .order_by(JobRecord.created.desc())
+            ).first()
+        if job_id is None:
+            return self.create_job(document, request_type, question, version_id)
+        if version_id is not None:
+            with Session(self.engine) as session, session.begin():
+                session.execute(update(JobRecord).where(JobRecord.id == job_id).values(version_id=version_id))
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[JobRecord]:
+        with Session(self.engine, expire_on_commit=False) as session:
+            return session.get(JobRecord, job_id)
+
+    def claim_next_job(self, worker: str) -> Optional[JobRecord]:
+        """Atomically claim the oldest pending job, or a running job whose lease has expired."""
+        now = time.time()
+        with Session(self.engine, expire_on_commit=False) as session:
+            candidates = session.scalars(
+                select(JobRecord.id)
+                .where(
+                    (JobRecord.status == "pending")
+                    | ((JobRecord.status == "running") & (JobRecord.updated < now - self.lease_seconds))
+                )
+                .order_by(JobRecord.created)
+                .limit(10)
+            ).all()
+            for job_id in candidates:
+                # The conditional update only succeeds for one of several competing workers
+                claimed = session.execute(
+                    update(JobRecord)
+                    .where(JobRecord.id == job_id)
+                    .where(
+                        (JobRecord.status == "pending")
+                        | ((JobRecord.status == "running") & (JobRecord.updated < now - self.lease_seconds))
+                    )
+                    .values(status="running", worker=worker, updated=now, attempts=JobRecord.attempts + 1)
+                ).rowcount
+                session.commit()
+                if claimed:
+                    return session.get(JobRecord, job_id)
+        return None
+
+    def start(self, job_id: str, worker: str):
+        with Session(self.engine) as session, session.begin():
+            session.execute(
+                update(JobRecord).where(JobRecord.id == job_id)
+                .values(status="running", worker=worker, updated=time.time(), attempts=JobRecord.attempts + 1)
+            )
+
+    def complete(self, job_id: str, result: str):
+        self._finish(job_id, status="done", result=result, error=None)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, status="failed", error=error)
+
+    def retry(self, job_id: str):
+        """Put a failed job back in the queue; its saved chunk results are kept."""
+        self._finish(job_id, status="pending", error=None)
+
+    def _finish(self, job_id: str, **values):
+        with Session(self.engine) as session, session.begin():
+            session.execute(update(JobRecord).where(JobRecord.id == job_id).values(updated=time.time(), **values))
+
+    def checkpoint(self, job_id: str, revision: Revision = None) -> JobCheckpoint:
+        """Checkpoint for a job; with a revision, chunk results of the previous version are reused too."""
+        if revision is None:
+            return JobCheckpoint(self, job_id)
+        return JobCheckpoint(self, job_id, text_hash(revision.previous_text), self.get_job(job_id).request_type)
+
+    def add_version(self, document: str, name: str, previous_id: str = None) -> DocumentVersion:
+        """Record a processed document, optionally as the next version of an earlier one."""
+        version_id = uuid.uuid4().hex
+        with Session(self.engine, expire_on_commit=False) as session, session.begin():
+            previous = session.get(DocumentVersion, previous_id) if previous_id else None
+            if previous_id and previous is None:
+                raise KeyError(f"Unknown document version: {previous_id}")
+            lineage = previous.lineage if previous else version_id
+            number = 1
+            if previous:
+                number = max(session.scalars(select(DocumentVersion.number).where(DocumentVersion.lineage == lineage))) + 1
+            version = DocumentVersion(
+                id=version_id, lineage=lineage, previous_id=previous_id, number=number, name=name,
+                document_hash=text_hash(document), document=document, created=time.time()
+            )
+            session.add(version)
+        return version
+
+    def get_version(self, version_id: str) -> Optional[DocumentVersion]:
+        with Session(self.engine, expire_on_commit=False) as session:
+            return session.get(DocumentVersion, version_id)
+
+    def revision(self, version_id: str) -> Optional[Revision]:
+        """What changed in a version since the one it revises, or None for a first version."""
+        version = self.get_version(version_id)
+        if version is None or version.previous_id is None:
+            return None
+        previous = self.get_version(version.previous_id)
+        with Session(self.engine) as session:
+            rows = session.scalars(select(DocumentChunks).where(DocumentChunks.document_hash == previous.document_hash)).all()
+            previous_chunks = {row.chunk_tokens: json.loads(row.chunks) for row in rows}
+        return Revision(
+            version.number, previous.number, previous.document,
+            diff_documents(previous.document, version.document), previous_chunks
+        )
+
+    def save_chunks(self, document: str, chunks: dict[int, list[str]]):
+        """Remember the chunks (by chunk size) a document was analyzed with."""
+        with Session(self.engine) as session, session.begin():
+            for chunk_tokens, texts in chunks.items():
+                session.merge(DocumentChunks(
+                    document_hash=text_hash(document), chunk_tokens=chunk_tokens, chunks=json.dumps(texts, ensure_ascii=False)
+                ))
+
+async def run_job(store: JobStore, processor, job: JobRecord) -> dict:
+    """Process a claimed job, resuming from its saved chunk results and, for a revision, from its previous version's."""
+    # Store calls are blocking database work, kept off the worker's event loop
+    revision = await asyncio.to_thread(store.revision, job.version_id) if job.version_id else None
+    checkpoint = await asyncio.to_thread(store.checkpoint, job.id, revision)
+    result = await processor.process_document(
+        job.document, job.request_type, job.question, checkpoint=checkpoint, revision=revision
+    )
+    if "error" in result:
+        await asyncio.to_thread(store.fail, job.id, result["error"])
+    else:
+        await asyncio.to_thread(store.complete, job.id, result["result"])
+        if revision is not None:
+            await asyncio.to_thread(store.save_chunks, job.document, revision.chunks)
+    return result
+
+async def run_worker(store: JobStore, processor, concurrency: int = 2, poll_interval: float = 2.0, once: bool = False):
+    """Claim and run jobs until stopped (or until the queue is empty when once=True)."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    running = set()
+    while True:
+        while len(running) < concurrency and (job := await asyncio.to_thread(store.claim_next_job, worker)) is not None:
+            logging.info(f"Worker {worker} claimed job {job.id} ({job.request_type}, attempt {job.attempts})")
+            running.add(asyncio.create_task(run_job(store, processor, job)))
+        if not running:
+            if once:
+                return
+            await asyncio.sleep(poll_interval)
+            continue
+        done, running = await asyncio.wait(running, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception():
+                logging.error(f"Job worker error: {task.exception()}")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    from src.document_processor import LegalDocumentProcessor
+    from src.llm_scheduler import BATCH, priority_scope
+    from src.metrics import serve_metrics
+    logging.basicConfig(level=logging.INFO)
+    if os.getenv("METRICS_PORT"):
+        serve_metrics(int(os.getenv("METRICS_PORT")))
+    with priority_scope(BATCH):
+        asyncio.run(run_worker(JobStore(), LegalDocumentProcessor(), concurrency=int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))))
@@ -0,0 +1,126 @@
+import os
+import math
+import random
+import asyncio
+import hashlib
+import time
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+class FakeRateLimitError(Exception):
+    """Injected failure; status_code 429 makes the scheduler treat it as provider throttling."""
+    status_code = 429
+
+class FakeChatModel:
+    """Offline stand-in for ChatOpenAI with deterministic output and simulated timing.
+
+    The reply and its latency are derived from a hash of the messages, so
+    the same prompt always produces the same text and timing. Latency is
+    log-normal around `latency_ms` (`latency_sigma` 0 makes it fixed), the
+    reply is streamed at `tokens_per_second`, and a seeded fraction
+    `error_rate` of calls fail with FakeRateLimitError.
+    """
+
+    def __init__(self, latency_ms: float = 200.0, latency_sigma: float = 0.0, tokens_per_second: float = 0.0,
+                 output_tokens: int = 64, error_rate: float = 0.0, seed: int = 0):
+        self.model_name = "fake"
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self._errors = random.Random(seed)
+
+    def _digest(self, messages) -> str:
+        digest = hashlib.sha256(str(self.seed).encode("utf-8"))
+        for message in messages:
+            digest.update(message.type.encode("utf-8"))
+            digest.update(message.content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _latency(self, digest: str) -> float:
+        """First-token latency in seconds for this prompt."""
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        rng = random.Random(digest)
+        return self.latency_ms / 1000 * math.exp(rng.gauss(0, self.latency_sigma))
+
+    def _words(self, messages, digest: str) -> list[str]:
+        """Deterministic reply: a tag for the prompt followed by words taken from its last message."""
+        source = messages[-1].content.split() or ["fake"]
+        start = int(digest[:8], 16) % len(source)
+        words = [f"[fake:{digest[:8]}]"]
+        while len(words) < self.output_tokens:
+            words.append(source[(start + len(words)) % len(source)])
+        return words
+
+    def _usage(self, messages, words: list[str]) -> dict:
+        prompt_tokens = sum(len(message.content.split()) for message in messages)
+        return {"input_tokens": prompt_tokens, "output_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+
+    def _start(self, messages) -> str:
+        self.calls += 1
+        if self.error_rate and self._errors.random() < self.error_rate:
+            raise FakeRateLimitError("Fake backend: simulated rate limit")
+        return self._digest(messages)
+
+    def _generation_seconds(self, word_count: int) -> float:
+        return word_count / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    async def ainvoke(self, messages) -> AIMessage:
+        digest = self._start(messages)
+        words = self._words(messages, digest)
+        await asyncio.sleep(self._latency(digest) + self._generation_seconds(len(words)))
+        return AIMessage(content=" ".join(words), usage_metadata=self._usage(messages, words))
+
+    def invoke(self, messages) -> AIMessage:
+        digest = self._start(messages)
+        words = self._words(messages, digest)
+        time.sleep(self._latency(digest) + self._generation_seconds(len(words)))
+        return AIMessage(content=" ".join(words), usage_metadata=self._usage(messages, words))
+
+    async def astream(self, messages):
+        digest = self._start(messages)
+        words = self._words(messages, digest)
+        await asyncio.sleep(self._latency(digest))
+        delay = self._generation_seconds(1)
+        for position, word in enumerate(words):
+            if delay:
+                await asyncio.sleep(delay)
+            yield AIMessageChunk(content=word if position == 0 else " " + word)
+        # Like ChatOpenAI with stream_usage=True, usage arrives in a final empty chunk
+        yield AIMessageChunk(content="", usage_metadata=self._usage(messages, words))
+
+def fake_model_from_env() -> FakeChatModel:
+    """Build the fake model from the FAKE_LLM_* environment variables."""
+    return FakeChatModel(
+        latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "200")),
+        latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+        output_tokens=int(os.getenv("FAKE_LLM_OUTPUT_TOKENS", "64")),
+        error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+        seed=int(os.getenv("FAKE_LLM_SEED", "0"))
+    )
+
+def create_model(model_name: str, temperature: float, backend: str = None):
+    """Create the chat model for LLM_BACKEND ("openai", the default, or "fake")."""
+    backend = (backend or os.getenv("LLM_BACKEND", "openai")).lower()
+    if backend == "fake":
+        return fake_model_from_env()
+    if backend != "openai":
+        raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in environment variables")
+    from langchain_openai import ChatOpenAI
+    # Retries are left to the scheduler; OPENAI_BASE_URL can point the
+    # client at a local OpenAI-compatible endpoint.
+    return ChatOpenAI(
+        model=model_name,
+        openai_api_key=api_key,
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        temperature=temperature,
+        max_retries=0,
+        stream_usage=True
+    )
@@ -0,0 +1,148 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+class LLMCache:
+    """Persistent content-addressed cache for LLM completions, stored in SQLite.
+
+    Entries are keyed by a hash of the model name, temperature, prompt
+    template version and the rendered messages. Entries older than max_age
+    seconds are dropped, and the least recently used entries are evicted
+    once the stored responses exceed max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, max_age: float = 30 * 24 * 3600, enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+        # Access times of hits, written with the next put instead of one commit per hit
+        self._touched = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(model_name: str, temperature, prompt_version: str, messages) -> str:
+        payload = json.dumps(
+            [model_name, temperature, prompt_version, [(m.type, m.content) for m in messages]],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return the cached response for key, or None on a miss or when the cache is bypassed."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= 100:
+                self._write_touched()
+                self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self._write_touched()
+            self._conn.commit()
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= 100:
+                self._evict(now)
+
+    def flush(self):
+        """Write pending access times."""
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def _write_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self, now: float):
+        self._puts_since_eviction = 0
+        self._write_touched()
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed")
+            stale = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                stale.append((key,))
+                excess -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+def cache_from_env() -> LLMCache:
+    """Build the cache from LLM_CACHE_* environment variables."""
+    try:
+        return LLMCache(
+            os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite")),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            max_age=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+            enabled=os.getenv("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+        )
+    except Exception as e:
+        logging.warning(f"LLM cache unavailable, falling back to in-memory cache: {e}")
+        return LLMCache(":memory:")
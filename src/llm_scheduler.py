@@ -0,0 +1,239 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+import threading
+from contextlib import contextmanager
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from src import metrics
+
+# Request priorities, lower runs first
+INTERACTIVE = 0
+NORMAL = 1
+BATCH = 2
+
+# How often queued calls check for a free slot and budget
+POLL_INTERVAL = 0.05
+
+# 429s arriving within this many seconds of a cut belong to the same burst
+THROTTLE_COOLDOWN = 1.0
+
+_priority = contextvars.ContextVar("llm_priority", default=NORMAL)
+
+@contextmanager
+def priority_scope(priority: int):
+    """Run model calls made inside the block (including tasks it spawns) at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def is_throttled(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+def is_retryable(error: Exception) -> bool:
+    """Throttling, timeouts, connection problems and provider-side 5xx errors are worth retrying."""
+    if is_throttled(error):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectError", "ReadTimeout")
+
+class TokenBucket:
+    """Continuously refilling budget of `capacity` units per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (requests larger than the capacity wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.available
+        return max(missing, 0.0) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.available -= amount
+
+class LLMScheduler:
+    """Admission control in front of the shared model client.
+
+    Calls wait for a concurrency slot and for requests-per-minute and
+    tokens-per-minute budget, highest priority first. The concurrency limit
+    is halved whenever the provider throttles us and grows back by one
+    after a run of successful calls. Failed calls are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_concurrency: int,
+                 min_concurrency: int = 1, max_attempts: int = 6, max_backoff: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max_concurrency
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.active = 0
+        self.successes = 0
+        self.throttled = 0
+        self.retries = 0
+        self._last_cut = 0.0
+        # Heap of [priority, sequence, tokens, granted] entries. Waiters poll
+        # instead of awaiting futures so the scheduler is not tied to one event
+        # loop: the Streamlit app runs all sessions on one shared background
+        # loop, while the API, batch runner and job worker run their own.
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _grant(self) -> float:
+        """Admit waiters in priority order while slots and budget allow; return the wait for the next one."""
+        while self._waiters and self.active < self.limit:
+            entry = self._waiters[0]
+            delay = max(self.requests.delay(1), self.tokens.delay(entry[2]))
+            if delay > 0:
+                return delay
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(entry[2])
+            self.active += 1
+            entry[3] = True
+        return POLL_INTERVAL
+
+    async def _acquire(self, tokens: int, priority: int = None):
+        entry = [_priority.get() if priority is None else priority, next(self._sequence), tokens, False]
+        started = time.perf_counter()
+        with self._lock:
+            heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._grant()
+                    if entry[3]:
+                        break
+                await asyncio.sleep(min(delay, POLL_INTERVAL))
+        except BaseException:
+            with self._lock:
+                if entry[3]:
+                    self.active -= 1
+                else:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            raise
+        metrics.record_queue(time.perf_counter() - started, entry[0])
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+            self._grant()
+
+    def _record(self, error: Exception = None):
+        with self._lock:
+            self._adjust(error)
+
+    def _adjust(self, error: Exception = None):
+        if error is None:
+            self.successes += 1
+            if self.successes % 10 == 0 and self.limit < self.max_concurrency:
+                self.limit += 1
+        elif is_throttled(error):
+            self.throttled += 1
+            metrics.registry.inc("legal_llm_throttled_total")
+            self.successes = 0
+            now = time.monotonic()
+            if now - self._last_cut < THROTTLE_COOLDOWN:
+                return
+            self._last_cut = now
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            logging.warning(f"LLM provider throttled us, concurrency limit now {self.limit}")
+
+    def settle(self, estimated_tokens: int, used_tokens: int):
+        """Correct the token budget once the real usage of a call is known."""
+        if used_tokens:
+            with self._lock:
+                self.tokens.take(used_tokens - estimated_tokens)
+
+    def _retrying(self):
+        return AsyncRetrying(
+            retry=retry_if_exception(is_retryable),
+            wait=wait_random_exponential(multiplier=1, max=self.max_backoff),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=self._before_retry,
+            reraise=True
+        )
+
+    def _before_retry(self, retry_state):
+        self.retries += 1
+        metrics.registry.inc("legal_llm_retries_total")
+        logging.warning(f"Retrying LLM call (attempt {retry_state.attempt_number}): {retry_state.outcome.exception()}")
+
+    async def run(self, call, estimated_tokens: int, priority: int = None):
+        """Await call() under the scheduler; call must create a fresh awaitable on every attempt."""
+        async for attempt in self._retrying():
+            with attempt:
+                await self._acquire(estimated_tokens, priority)
+                try:
+                    result = await call()
+                except Exception as e:
+                    self._record(e)
+                    raise
+                finally:
+                    self._release()
+                self._record()
+                return result
+
+    async def stream(self, open_stream, estimated_tokens: int, priority: int = None):
+        """Yield from open_stream() under the scheduler.
+
+        A failed stream is retried only if it failed before producing any
+        output; afterwards the error is raised to the caller.
+        """
+        async for attempt in self._retrying():
+            with attempt:
+                await self._acquire(estimated_tokens, priority)
+                started = False
+                try:
+                    async for item in open_stream():
+                        started = True
+                        yield item
+                except Exception as e:
+                    self._record(e)
+                    if started:
+                        raise RuntimeError(f"LLM stream interrupted: {e}") from e
+                    raise
+                finally:
+                    self._release()
+                self._record()
+                return
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "concurrency_limit": self.limit,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+def scheduler_from_env() -> LLMScheduler:
+    """Build the scheduler from LLM_RPM, LLM_TPM and LLM_GLOBAL_CONCURRENCY."""
+    return LLMScheduler(
+        requests_per_minute=float(os.getenv("LLM_RPM", "500")),
+        tokens_per_minute=float(os.getenv("LLM_TPM", "200000")),
+        max_concurrency=int(os.getenv("LLM_GLOBAL_CONCURRENCY", "32")),
+        max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "6"))
+    )
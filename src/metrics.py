@@ -0,0 +1,272 @@
+"""Timing, token, cost and cache instrumentation.
+
+Spans and per-request summaries are written as JSON lines to the
+"metrics" logger and aggregated into an in-process registry that can be
+rendered in the Prometheus text format (served by the API at /metrics,
+or by serve_metrics() for the batch runner and job worker).
+
+Only this process's metrics are visible: page extraction in worker
+processes is recorded in the parent from the returned PageText timings.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+# USD per million (input, output) tokens; override with LLM_PRICE_INPUT / LLM_PRICE_OUTPUT
+MODEL_PRICES = {
+    "gpt-5-2025-08-07": (1.25, 10.0),
+    "fake": (0.0, 0.0),
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HELP = {
+    "legal_span_seconds": "Duration of instrumented spans",
+    "legal_page_seconds": "Extraction time per page by source (text layer, OCR, skipped)",
+    "legal_pages_total": "Extracted pages by source",
+    "legal_llm_queue_seconds": "Time LLM calls waited in the scheduler for a slot and budget",
+    "legal_llm_tokens_total": "LLM tokens by model and kind (prompt or completion)",
+    "legal_llm_cost_usd_total": "Estimated LLM cost in USD",
+    "legal_llm_throttled_total": "Calls rejected by the provider with a 429",
+    "legal_llm_retries_total": "Retried LLM calls",
+    "legal_cache_requests_total": "Cache lookups by cache and result (hit or miss)",
+    "legal_requests_total": "Processed requests by type and status",
+    "legal_request_seconds": "End-to-end request duration by type",
+    "legal_request_cost_usd": "Estimated LLM cost per request",
+    "legal_normalizer_tokens_total": "Document tokens before and after text normalization",
+}
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and labels."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][position] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def counter(self, name: str, **labels) -> float:
+        """Sum of a counter over every label set that includes the given labels."""
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for (metric, key), value in self.counters.items() if metric == name and wanted <= set(key))
+
+    def cache_hit_rate(self, cache: str) -> float:
+        hits = self.counter("legal_cache_requests_total", cache=cache, result="hit")
+        total = hits + self.counter("legal_cache_requests_total", cache=cache, result="miss")
+        return hits / total if total else 0.0
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, {**value, "buckets": list(value["buckets"])}) for key, value in self.histograms.items())
+        lines = []
+        typed = set()
+
+        def header(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        def labels_text(labels) -> str:
+            if not labels:
+                return ""
+            escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{labels_text(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{name}_bucket{labels_text(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{name}_bucket{labels_text(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{labels_text(labels)} {histogram['sum']:g}")
+            lines.append(f"{name}_count{labels_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+@dataclass
+class RequestStats:
+    """Totals for one processed request, shared by every task working on it."""
+    request_type: str
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started: float = field(default_factory=time.perf_counter)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    queue_seconds: float = 0.0
+    cache_hits: int = 0
+    status: str = "ok"  # "error" or the exception name when the request failed
+
+_request = contextvars.ContextVar("metrics_request", default=None)
+
+def log_event(event: str, **fields):
+    """Write one structured log line, tagged with the current request."""
+    stats = _request.get()
+    if stats is not None:
+        fields = {"request_id": stats.request_id, "request_type": stats.request_type, **fields}
+    logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
+
+@contextmanager
+def span(name: str, labels: dict = None, **fields):
+    """Time a block: `labels` become metric labels (keep them low-cardinality), `fields` only go to the log."""
+    labels = labels or {}
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe("legal_span_seconds", seconds, span=name, **labels)
+        log_event("span", span=name, seconds=round(seconds, 4), status=status, **labels, **fields)
+
+def model_price(model_name: str) -> tuple[float, float]:
+    default = MODEL_PRICES.get(model_name, (0.0, 0.0))
+    return (
+        float(os.getenv("LLM_PRICE_INPUT") or default[0]),
+        float(os.getenv("LLM_PRICE_OUTPUT") or default[1]),
+    )
+
+def record_llm_usage(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Count one completed model call's tokens and return its estimated cost."""
+    input_price, output_price = model_price(model_name)
+    cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    registry.inc("legal_llm_tokens_total", prompt_tokens, model=model_name, kind="prompt")
+    registry.inc("legal_llm_tokens_total", completion_tokens, model=model_name, kind="completion")
+    registry.inc("legal_llm_cost_usd_total", cost, model=model_name)
+    stats = _request.get()
+    if stats is not None:
+        stats.llm_calls += 1
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        stats.cost_usd += cost
+    return cost
+
+def record_cache(cache: str, hit: bool):
+    registry.inc("legal_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+    stats = _request.get()
+    if hit and stats is not None:
+        stats.cache_hits += 1
+
+def record_queue(seconds: float, priority: int):
+    registry.observe("legal_llm_queue_seconds", seconds, priority=priority)
+    stats = _request.get()
+    if stats is not None:
+        stats.queue_seconds += seconds
+
+def record_page(page):
+    """Record an extracted PageText (timed wherever it was extracted)."""
+    registry.inc("legal_pages_total", source=page.source)
+    if page.seconds:
+        registry.observe("legal_page_seconds", page.seconds, source=page.source)
+        log_event("span", span="page", page=page.page_number, source=page.source, triage=page.triage, seconds=round(page.seconds, 4))
+
+def _start_request(request_type: str) -> RequestStats:
+    stats = RequestStats(request_type)
+    _request.set(stats)
+    return stats
+
+def _finish_request(stats: RequestStats):
+    seconds = time.perf_counter() - stats.started
+    registry.inc("legal_requests_total", request_type=stats.request_type, status=stats.status)
+    registry.observe("legal_request_seconds", seconds, request_type=stats.request_type)
+    registry.observe("legal_request_cost_usd", stats.cost_usd, request_type=stats.request_type)
+    log_event(
+        "request", request_id=stats.request_id, request_type=stats.request_type, status=stats.status, seconds=round(seconds, 3), llm_calls=stats.llm_calls,
+        prompt_tokens=stats.prompt_tokens, completion_tokens=stats.completion_tokens,
+        cost_usd=round(stats.cost_usd, 6), queue_seconds=round(stats.queue_seconds, 3), cache_hits=stats.cache_hits
+    )
+
+@contextmanager
+def track_request(request_type: str):
+    """Attribute the tokens, cost and cache hits of everything inside the block to one request."""
+    stats = RequestStats(request_type)
+    token = _request.set(stats)
+    try:
+        yield stats
+    except BaseException as e:
+        stats.status = type(e).__name__
+        raise
+    finally:
+        _finish_request(stats)
+        _request.reset(token)
+
+async def track_request_events(request_type: str, events):
+    """track_request for an async generator.
+
+    Each step runs as a task in one private context, so the request stays
+    attributed even when the consumer drives the generator from different
+    tasks or event loops (as the Streamlit app does).
+    """
+    context = contextvars.copy_context()
+    stats = context.run(_start_request, request_type)
+    try:
+        while True:
+            try:
+                event = await asyncio.create_task(events.__anext__(), context=context)
+            except StopAsyncIteration:
+                break
+            yield event
+    except BaseException as e:
+        stats.status = type(e).__name__
+        raise
+    finally:
+        _finish_request(stats)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve the registry in Prometheus format from a background thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,232 @@
+import difflib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+import numpy as np
+from src.retrieval import tokenize
+
+# Words per shingle; the similarity of two chunks is the Jaccard similarity of their shingle sets
+SHINGLE_WORDS = 5
+NUM_PERMUTATIONS = 128
+# LSH bands x rows = NUM_PERMUTATIONS; pairs above ~0.7 similarity almost always share a band
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+# Hashes are taken modulo a prime below 2^32 so a * h + b stays inside uint64
+_PRIME = np.uint64(4294967291)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2 ** 32 - 5, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 5, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+# Unchanged words kept around each difference in word_diff, and the most differences listed
+DIFF_CONTEXT_WORDS = 4
+MAX_DIFFERENCES = 40
+# Stale entries are dropped on open and after this many additions
+EVICT_EVERY = 1000
+
+@dataclass
+class NearDuplicate:
+    """A stored chunk similar to the one looked up.
+
+    exact is True when both have the same words (only case, diacritics,
+    script, layout or line breaks differ), so the stored output applies
+    as it is; otherwise the chunk needs analysis, guided by word_diff.
+    """
+    text: str
+    output: str
+    similarity: float
+    exact: bool
+
+def shingles(text: str) -> set[int]:
+    """Hashes of the overlapping word n-grams of a text (case, diacritics and layout ignored)."""
+    words = tokenize(text)
+    if len(words) < SHINGLE_WORDS:
+        words = words + [""] * (SHINGLE_WORDS - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8"), digest_size=4).digest(), "little")
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+def minhash(text: str) -> np.ndarray:
+    hashes = np.fromiter(shingles(text), dtype=np.uint64)
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0)
+
+def similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return float(np.mean(signature == other))
+
+def word_fingerprint(text: str) -> str:
+    """Hash of the folded word sequence: equal for texts that differ only in case, diacritics, script or layout."""
+    return hashlib.sha256(" ".join(tokenize(text)).encode("utf-8")).hexdigest()
+
+def word_diff(old: str, new: str) -> str:
+    """Plain-text list of the word runs that differ between two texts, with a few words of context."""
+    old_words, new_words = old.split(), new.split()
+    lines = []
+    matcher = difflib.SequenceMatcher(None, [w.lower() for w in old_words], [w.lower() for w in new_words], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        before = " ".join(new_words[max(0, j1 - DIFF_CONTEXT_WORDS):j1])
+        after = " ".join(new_words[j2:j2 + DIFF_CONTEXT_WORDS])
+        lines.append(
+            f"- „…{before} [{' '.join(new_words[j1:j2])}] {after}…“ "
+            f"(ranije: [{' '.join(old_words[i1:i2])}])"
+        )
+    if len(lines) > MAX_DIFFERENCES:
+        lines = lines[:MAX_DIFFERENCES] + [f"- … i još {len(lines) - MAX_DIFFERENCES} razlika"]
+    return "\n".join(lines)
+
+class NearDuplicateIndex:
+    """Persistent MinHash/LSH index of analyzed chunks and their outputs, stored in SQLite.
+
+    Contracts drafted from the same template share most of their clauses
+    word for word, but layout, OCR and line breaks differ, so exact caching
+    rarely hits. lookup returns the most similar stored chunk at or above
+    the threshold. Its output is only reusable as it is when the words
+    match exactly; a chunk with any changed word is analyzed again, with
+    the stored chunk's output and the word differences as guidance.
+    Entries are scoped by prompt, so outputs are only reused for the same
+    kind of analysis.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.9, max_age: float = 90 * 24 * 3600, enabled: bool = True):
+        self.path = path
+        self.threshold = threshold
+        self.max_age = max_age
+        self.enabled = enabled
+        self.hits = 0
+        self.templates = 0
+        self.misses = 0
+        self._added = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if columns and "words" not in columns:
+            # Entries from before exact-word matching have no text to compare against
+            logging.info("Dropping near-duplicate entries stored without their text")
+            self._conn.execute("DROP TABLE chunks")
+            self._conn.execute("DROP TABLE IF EXISTS bands")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, scope TEXT NOT NULL, signature BLOB NOT NULL, words TEXT NOT NULL, "
+            "text TEXT NOT NULL, output TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands ("
+            "scope TEXT NOT NULL, band INTEGER NOT NULL, bucket TEXT NOT NULL, chunk_id INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (scope, band, bucket)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_chunk ON bands (chunk_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_created ON chunks (created)")
+        self._conn.commit()
+        if enabled:
+            self.evict()
+
+    @staticmethod
+    def make_scope(model_name: str, prompt_version: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\n{prompt_version}\n{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _buckets(signature: np.ndarray) -> list[tuple[int, str]]:
+        return [
+            (band, hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(), digest_size=8).hexdigest())
+            for band in range(LSH_BANDS)
+        ]
+
+    def lookup(self, scope: str, text: str):
+        """Return the stored chunk with the same words or, failing that, the most similar one; None below the threshold."""
+        if not self.enabled:
+            return None
+        signature = minhash(text)
+        words = word_fingerprint(text)
+        buckets = self._buckets(signature)
+        with self._lock:
+            candidates = set()
+            for band, bucket in buckets:
+                candidates.update(row[0] for row in self._conn.execute(
+                    "SELECT chunk_id FROM bands WHERE scope = ? AND band = ? AND bucket = ?", (scope, band, bucket)
+                ))
+            best = None
+            for chunk_id in candidates:
+                row = self._conn.execute(
+                    "SELECT signature, words, text, output, created FROM chunks WHERE id = ?", (chunk_id,)
+                ).fetchone()
+                if row is None or time.time() - row[4] > self.max_age:
+                    continue
+                score = similarity(signature, np.frombuffer(row[0], dtype=np.uint64))
+                match = NearDuplicate(row[2], row[3], score, row[1] == words)
+                if score >= self.threshold and (best is None or (match.exact, score) > (best.exact, best.similarity)):
+                    best = match
+            if best is None:
+                self.misses += 1
+            elif best.exact:
+                self.hits += 1
+                logging.info(f"Reusing the analysis of a chunk with the same words (similarity {best.similarity:.2f})")
+            else:
+                self.templates += 1
+                logging.info(f"Chunk differs from analyzed template text in some words (similarity {best.similarity:.2f})")
+            return best
+
+    def add(self, scope: str, text: str, output: str):
+        if not self.enabled:
+            return
+        signature = minhash(text)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO chunks (scope, signature, words, text, output, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, signature.tobytes(), word_fingerprint(text), text, output, time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO bands (scope, band, bucket, chunk_id) VALUES (?, ?, ?, ?)",
+                [(scope, band, bucket, cursor.lastrowid) for band, bucket in self._buckets(signature)]
+            )
+            self._conn.commit()
+            self._added += 1
+        if self._added % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age."""
+        with self._lock:
+            stale = self._conn.execute("SELECT id FROM chunks WHERE created < ?", (time.time() - self.max_age,)).fetchall()
+            self._conn.executemany("DELETE FROM bands WHERE chunk_id = ?", stale)
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", stale)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        lookups = self.hits + self.templates + self.misses
+        return {
+            "hits": self.hits,
+            "templates": self.templates,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+def near_duplicate_index_from_env() -> NearDuplicateIndex:
+    """Build the index from NEAR_DUPLICATE_* environment variables."""
+    try:
+        return NearDuplicateIndex(
+            os.getenv("NEAR_DUPLICATE_PATH", os.path.join(".cache", "near_duplicates.sqlite")),
+            threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")),
+            max_age=float(os.getenv("NEAR_DUPLICATE_MAX_AGE_DAYS", "90")) * 24 * 3600,
+            enabled=os.getenv("NEAR_DUPLICATE_DISABLED", "").lower() not in ("1", "true", "yes")
+        )
+    except Exception as e:
+        logging.warning(f"Near-duplicate index unavailable, falling back to in-memory index: {e}")
+        return NearDuplicateIndex(":memory:")
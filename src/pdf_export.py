@@ -0,0 +1,25 @@
+import logging
+from fpdf import FPDF, XPos, YPos
+
+def create_pdf_from_text(text: str, title: str) -> bytes:
+    """Convert text to PDF and return as bytes"""
+    try:
+        pdf = FPDF()
+        pdf.add_page()
+        
+        # Use Helvetica (built-in font) instead of Arial
+        pdf.set_font("helvetica", "B", 16)
+        # Update cell parameters to use new positioning
+        pdf.cell(0, 10, title.encode('latin-1', 'replace').decode('latin-1'), 
+                new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+        pdf.ln(10)
+        
+        # Use Helvetica for content
+        pdf.set_font("helvetica", size=12)
+        safe_text = text.encode('latin-1', 'replace').decode('latin-1')
+        pdf.multi_cell(0, 10, safe_text)
+        
+        return bytes(pdf.output())
+    except Exception as e:
+        logging.error(f"Error creating PDF: {e}")
+        raise
@@ -1,12 +1,63 @@
 import fitz  # PyMuPDF for PDF text extraction
-import pytesseract  # Tesseract OCR
-from PIL import Image
+from PIL import Image, ImageStat
 import logging
 import os
+import time
 import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from src.extraction_cache import ExtractionCache, extraction_cache_from_env
+from src.text_normalizer import normalize_records
+from src import metrics
+
+OCR_LANG = os.getenv("OCR_LANG", "srp")
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "1").lower() in ("1", "true", "yes")
+# 0-255 cut-off for black/white rendering; empty keeps grey levels
+OCR_BINARIZE_THRESHOLD = int(os.getenv("OCR_BINARIZE_THRESHOLD") or 0) or None
+
+# Worker processes for page-parallel extraction; small documents are extracted in-process
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "8"))
+
+# Page triage: pages with at least this much text layer are not OCR'd
+TRIAGE_MIN_TEXT_CHARS = int(os.getenv("TRIAGE_MIN_TEXT_CHARS", "50"))
+# Pages whose images cover less of the page than this only carry stamps, signatures or logos
+TRIAGE_MIN_IMAGE_COVERAGE = float(os.getenv("TRIAGE_MIN_IMAGE_COVERAGE", "0.15"))
+# Thumbnail grey-level standard deviation below which a scan is considered blank
+TRIAGE_MIN_PIXEL_STDDEV = float(os.getenv("TRIAGE_MIN_PIXEL_STDDEV", "2.5"))
+TRIAGE_THUMBNAIL_DPI = 18
+# Bumped when triage rules change, so pages cached under the old rules are extracted again
+TRIAGE_VERSION = 2
+TRIAGE_SETTINGS = f"v={TRIAGE_VERSION};text={TRIAGE_MIN_TEXT_CHARS};cover={TRIAGE_MIN_IMAGE_COVERAGE};stddev={TRIAGE_MIN_PIXEL_STDDEV}"
+
+_extraction_cache = None
+_extraction_cache_pid = None
+
+def get_extraction_cache() -> ExtractionCache:
+    """Return this process's extraction cache (see EXTRACTION_CACHE_* environment variables).
+
+    Opened per process: a SQLite connection must not be shared with forked children.
+    """
+    global _extraction_cache, _extraction_cache_pid
+    if _extraction_cache is None or _extraction_cache_pid != os.getpid():
+        _extraction_cache = extraction_cache_from_env()
+        _extraction_cache_pid = os.getpid()
+    return _extraction_cache
+
+@dataclass
+class PageText:
+    page_number: int
+    text: str
+    source: str  # "text" (text layer), "ocr", "skip", "ocr_failed" or "error"
+    triage: str = ""  # why the page was routed to its source
+    seconds: float = 0.0  # extraction time; 0 when served from the cache
 
 def setup_tesseract():
     """Configure Tesseract based on environment"""
+    # Imported on first use: pytesseract pulls in pandas when available
+    import pytesseract
     try:
         if platform.system() == "Windows":
             pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
@@ -15,41 +66,265 @@ def setup_tesseract():
     except Exception as e:
         logging.warning(f"Tesseract setup warning: {e}")
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from a PDF file using PyMuPDF and Tesseract OCR for image-based pages."""
-    setup_tesseract()
-    text_output = ""
+def ocr_settings(lang: str = OCR_LANG, dpi: int = OCR_DPI, grayscale: bool = OCR_GRAYSCALE, binarize_threshold: int = OCR_BINARIZE_THRESHOLD) -> str:
+    """Settings that affect OCR output; part of the extraction cache key."""
+    return f"lang={lang};dpi={dpi};gray={grayscale};bin={binarize_threshold}"
+
+class OcrEngine:
+    """Renders pages and runs Tesseract on them with settings fixed for the engine's lifetime.
+
+    Tesseract is configured once per engine. When the optional tesserocr
+    package is installed, one Tesseract API instance is kept open so the
+    language data stays loaded across pages; otherwise every page goes
+    through the pytesseract command-line wrapper.
+    """
+
+    def __init__(self, lang: str = OCR_LANG, dpi: int = OCR_DPI, grayscale: bool = OCR_GRAYSCALE, binarize_threshold: int = OCR_BINARIZE_THRESHOLD):
+        self.lang = lang
+        self.dpi = dpi
+        self.grayscale = grayscale
+        self.binarize_threshold = binarize_threshold
+        setup_tesseract()
+        self._api = None
+        try:
+            import tesserocr
+            self._api = tesserocr.PyTessBaseAPI(lang=lang, path=os.environ.get("TESSDATA_PREFIX", ""))
+        except ImportError:
+            pass
+        except Exception as e:
+            logging.warning(f"tesserocr unavailable, falling back to pytesseract: {e}")
+
+    @property
+    def settings(self) -> str:
+        return ocr_settings(self.lang, self.dpi, self.grayscale, self.binarize_threshold)
+
+    def render(self, page) -> tuple[fitz.Pixmap, Image.Image]:
+        """Render a page for OCR.
+
+        The image wraps the pixmap's sample buffer instead of copying it, so
+        the returned pixmap must be kept alive for as long as the image is used.
+        """
+        colorspace = fitz.csGRAY if self.grayscale or self.binarize_threshold else fitz.csRGB
+        pix = page.get_pixmap(dpi=self.dpi, colorspace=colorspace, alpha=False)
+        mode = "L" if pix.n == 1 else "RGB"
+        img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+        if self.binarize_threshold:
+            threshold = self.binarize_threshold
+            img = img.point(lambda value: 255 if value > threshold else 0)
+        return pix, img
+
+    def recognize(self, page) -> str:
+        pix, img = self.render(page)
+        if self._api is not None:
+            self._api.SetImage(img)
+            return self._api.GetUTF8Text()
+        import pytesseract
+        return pytesseract.image_to_string(img, lang=self.lang)
+
+    def close(self):
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+
+def worker_context():
+    """Start method for extraction worker pools.
+
+    The app and the API call in from threaded hosts (Streamlit script
+    threads, the scheduler's event loop thread), where a plain fork can
+    copy a lock held by another thread and deadlock the child.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Workers are forked from a server that has already imported the extractor
+    context.set_forkserver_preload(["src.pdf_extractor"])
+    return context
+
+_ocr_engine = None
+_ocr_engine_pid = None
+
+def get_ocr_engine() -> OcrEngine:
+    """Return this process's OCR engine, creating it on first use.
+
+    Forked extraction workers get a fresh engine instead of sharing the
+    parent's Tesseract handle.
+    """
+    global _ocr_engine, _ocr_engine_pid
+    if _ocr_engine is None or _ocr_engine_pid != os.getpid():
+        _ocr_engine = OcrEngine()
+        _ocr_engine_pid = os.getpid()
+    return _ocr_engine
+
+def extract_text_from_pdf(pdf, normalize: bool = True) -> str:
+    """Extract text from a PDF (file path or bytes) using PyMuPDF and Tesseract OCR for image-based pages."""
+    return "\n".join(extract_pages_from_pdf(pdf, normalize)).strip()
+
+def extract_pages_from_pdf(pdf, normalize: bool = True) -> list[str]:
+    """Extract text page by page, using Tesseract OCR for image-based pages.
+
+    With `normalize`, repeated headers and footers and OCR noise are removed (see text_normalizer).
+    """
+    records = extract_page_records(pdf)
+    if normalize:
+        return normalize_records(records)[0]
+    return [page.text for page in records]
+
+def extract_page_records(pdf, content_hash: str = None) -> list[PageText]:
+    """Extract per-page text and its source, served from the extraction cache when possible."""
+    return list(iter_page_records(pdf, content_hash=content_hash))
+
+def as_pdf_source(pdf):
+    """Normalize a PDF argument: paths are kept, in-memory data becomes bytes.
+
+    PyMuPDF only reads bytes streams without copying them, so a memoryview
+    over a whole bytes object is unwrapped; other buffers are copied once.
+    """
+    if isinstance(pdf, (str, os.PathLike, bytes)):
+        return pdf
+    if isinstance(pdf, memoryview) and isinstance(pdf.obj, bytes) and pdf.nbytes == len(pdf.obj):
+        return pdf.obj
+    return bytes(pdf)
+
+def open_pdf(pdf) -> fitz.Document:
+    """Open a PDF from a file path or from bytes in memory."""
+    if isinstance(pdf, bytes):
+        return fitz.open(stream=pdf, filetype="pdf")
+    return fitz.open(pdf)
+
+def iter_page_records(pdf, progress_callback=None, workers: int = None, content_hash: str = None):
+    """Yield PageText records in page order as soon as each page is extracted.
+
+    pdf is a file path, or the document itself as bytes, bytearray or a
+    memoryview (e.g. an upload buffer), which is read without a temp file.
+    progress_callback, if given, is called as progress_callback(done, total, page)
+    after every page. Complete extractions are stored in the extraction cache.
+    content_hash is the SHA-256 of the PDF when the caller already has it,
+    so the document is not read and hashed again.
+    """
+    pdf = as_pdf_source(pdf)
+    # Part of the cache key, so changing OCR or triage settings invalidates cached pages.
+    # Built from the settings alone: creating the engine loads Tesseract, which cache hits never need
+    key = ExtractionCache.make_key(content_hash or ExtractionCache.content_hash(pdf), f"{ocr_settings()};{TRIAGE_SETTINGS}")
+    cached = get_extraction_cache().get(key)
+    metrics.record_cache("extraction", cached is not None)
+    if cached is not None:
+        for page_number, text, source, triage in cached:
+            page = PageText(page_number, text, source, triage)
+            if progress_callback:
+                progress_callback(page_number, len(cached), page)
+            yield page
+        return
+    pages = []
+    doc = open_pdf(pdf)
+    try:
+        page_count = len(doc)
+    finally:
+        doc.close()
+    for page in _iter_page_ranges(pdf, page_count, workers):
+        metrics.record_page(page)
+        pages.append(page)
+        if progress_callback:
+            progress_callback(len(pages), page_count, page)
+        yield page
+    # Failed pages may succeed on a retry, so only complete extractions are cached
+    if all(page.source not in ("ocr_failed", "error") for page in pages):
+        get_extraction_cache().put(key, ((page.page_number, page.text, page.source, page.triage) for page in pages))
+
+def _iter_page_ranges(pdf, page_count: int, workers: int = None):
+    """Extract all pages in order, spreading page ranges over a process pool for larger documents."""
+    workers = min(workers or EXTRACTION_WORKERS, page_count)
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        yield from _iter_page_range(pdf, 0, page_count)
+        return
+
+    # Several contiguous ranges per worker keep the pool busy when OCR pages cluster
+    range_size = max(1, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+    # In-memory documents are sent to each worker once, not with every range
+    in_memory = isinstance(pdf, bytes)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=worker_context(),
+        initializer=_set_worker_pdf if in_memory else None,
+        initargs=(pdf,) if in_memory else ()
+    )
+    with pool:
+        futures = [pool.submit(_extract_page_range, None if in_memory else pdf, start, stop) for start, stop in ranges]
+        for (start, stop), future in zip(ranges, futures):
+            try:
+                yield from future.result()
+            except Exception as e:
+                logging.error(f"Extraction worker failed on pages {start + 1}-{stop}: {e}")
+                yield from (PageText(page_num + 1, "", "error") for page_num in range(start, stop))
+
+_worker_pdf = None
+
+def _set_worker_pdf(pdf: bytes):
+    global _worker_pdf
+    _worker_pdf = pdf
+
+def _extract_page_range(pdf, start: int, stop: int) -> list[PageText]:
+    """Worker entry point; pdf is None for in-memory documents handed over by _set_worker_pdf."""
+    return list(_iter_page_range(_worker_pdf if pdf is None else pdf, start, stop))
+
+def _iter_page_range(pdf, start: int, stop: int):
+    """Extract pages [start, stop) with a dedicated document handle; failed pages are marked "error"."""
     doc = None
     
     try:
-        doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            # Try basic text extraction first
-            text = page.get_text("text")
-            if text.strip():
-                text_output += text + "\n"
-            else:
-                try:
-                    # Try OCR if available
-                    pix = page.get_pixmap()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    ocr_text = pytesseract.image_to_string(img, lang="srp")
-                    text_output += ocr_text + "\n"
-                except Exception as ocr_error:
-                    logging.warning(f"OCR failed, using basic extraction: {ocr_error}")
-                    text_output += text + "\n"
-        
-        return text_output.strip()
+        doc = open_pdf(pdf)
+        for page_num in range(start, stop):
+            started = time.perf_counter()
+            try:
+                page = _extract_page(doc[page_num], page_num + 1)
+            except Exception as page_error:
+                logging.error(f"Error extracting page {page_num + 1}: {page_error}")
+                page = PageText(page_num + 1, "", "error")
+            page.seconds = time.perf_counter() - started
+            yield page
     except Exception as e:
         logging.error(f"Error extracting text from PDF: {e}")
         raise
     finally:
-        try:
-            if doc:
-                doc.close()
-            # Clean up temporary file
-            if os.path.exists(pdf_path) and pdf_path.startswith("temp_"):
-                os.remove(pdf_path)
-        except Exception as cleanup_error:
-            logging.warning(f"Error during cleanup: {cleanup_error}")
+        if doc:
+            doc.close()
+
+def triage_page(page, text: str) -> tuple[str, str]:
+    """Decide cheaply how a page should be extracted.
+
+    Returns ("text" | "ocr" | "skip", reason). Pages without a usable text
+    layer are sent to OCR when their low-resolution thumbnail shows actual
+    ink: scans, and pages whose text was converted to vector outlines and
+    so carry no images at all. Blank separators and pages that only carry
+    a stamp, signature or logo are skipped.
+    """
+    text_chars = len(text.strip())
+    images = page.get_image_info()
+    page_area = abs(page.rect) or 1
+    coverage = min(sum(abs(fitz.Rect(image["bbox"]) & page.rect) for image in images) / page_area, 1.0)
+    if text_chars >= TRIAGE_MIN_TEXT_CHARS or (text_chars and coverage < TRIAGE_MIN_IMAGE_COVERAGE):
+        return "text", f"text layer ({text_chars} chars)"
+    if images and coverage < TRIAGE_MIN_IMAGE_COVERAGE:
+        return "skip", f"images cover {coverage:.0%} of the page ({len(images)} images)"
+    thumbnail = page.get_pixmap(dpi=TRIAGE_THUMBNAIL_DPI, colorspace=fitz.csGRAY, alpha=False)
+    stats = ImageStat.Stat(Image.frombuffer("L", (thumbnail.width, thumbnail.height), thumbnail.samples_mv, "raw", "L", thumbnail.stride, 1))
+    if stats.stddev[0] < TRIAGE_MIN_PIXEL_STDDEV:
+        return "skip", f"blank page (pixel stddev {stats.stddev[0]:.1f})"
+    if not images:
+        reason = "no text layer or images, ink in vector drawings"
+    else:
+        reason = "partial text layer over scanned image" if text_chars else "image-only page"
+    return "ocr", f"{reason} ({coverage:.0%} image coverage, pixel stddev {stats.stddev[0]:.1f})"
+
+def _extract_page(page, page_number: int) -> PageText:
+    text = page.get_text("text")
+    decision, reason = triage_page(page, text)
+    if decision == "text":
+        return PageText(page_number, text, "text", reason)
+    if decision == "skip":
+        return PageText(page_number, text, "skip", reason)
+    try:
+        return PageText(page_number, get_ocr_engine().recognize(page), "ocr", reason)
+    except Exception as ocr_error:
+        logging.warning(f"OCR failed, using basic extraction: {ocr_error}")
+        return PageText(page_number, text, "ocr_failed", reason)
@@ -0,0 +1,125 @@
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from src.chunker import chunk_text
+
+# Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Rank constant for reciprocal rank fusion of lexical and embedding results
+RRF_K = 60
+
+# sentence-transformers model that embeds passages alongside BM25; empty for BM25 only
+RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "")
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+CYRILLIC_TO_LATIN = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "ђ": "đ", "е": "e", "ж": "ž", "з": "z", "и": "i",
+    "ј": "j", "к": "k", "л": "l", "љ": "lj", "м": "m", "н": "n", "њ": "nj", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "ћ": "ć", "у": "u", "ф": "f", "х": "h", "ц": "c", "ч": "č", "џ": "dž", "ш": "š",
+})
+
+@dataclass
+class Passage:
+    passage_id: int
+    page: int
+    text: str
+
+def fold(token: str) -> str:
+    """Lowercase, transliterate Cyrillic to Latin and strip diacritics (đ becomes dj)."""
+    token = token.lower().translate(CYRILLIC_TO_LATIN).replace("đ", "dj")
+    return "".join(c for c in unicodedata.normalize("NFKD", token) if not unicodedata.combining(c))
+
+def tokenize(text: str) -> list[str]:
+    """Split into word tokens and fold each one; token i is the i-th WORD_PATTERN match of the text."""
+    return [fold(token) for token in WORD_PATTERN.findall(text)]
+
+class SentenceTransformerEmbedder:
+    """Local embedding backend built on sentence-transformers (optional dependency)."""
+
+    def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("sentence-transformers is required for the embedding retrieval backend") from e
+        self.model = SentenceTransformer(model_name)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return self.model.encode(texts, normalize_embeddings=True).tolist()
+
+@lru_cache(maxsize=None)
+def get_embedder():
+    """The embedder selected by RETRIEVAL_EMBEDDER, loaded once; None for BM25-only retrieval."""
+    if not RETRIEVAL_EMBEDDER:
+        return None
+    try:
+        return SentenceTransformerEmbedder(RETRIEVAL_EMBEDDER)
+    except Exception as e:
+        logging.warning(f"Embedding retrieval unavailable, falling back to BM25 only: {e}")
+        return None
+
+class PassageIndex:
+    """Per-document passage index for retrieving the parts relevant to a question.
+
+    Lexical scoring uses BM25 over an inverted index. When an embedder is
+    given, passages are also embedded once and both rankings are merged
+    with reciprocal rank fusion.
+    """
+
+    def __init__(self, passages: list[Passage], embedder=None):
+        self.passages = passages
+        self.embedder = embedder
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for passage in passages:
+            terms = Counter(tokenize(passage.text))
+            self.lengths.append(sum(terms.values()))
+            for term, freq in terms.items():
+                self.postings[term].append((passage.passage_id, freq))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.vectors = embedder.embed([p.text for p in passages]) if embedder and passages else None
+
+    @classmethod
+    def from_pages(cls, pages: list[str], passage_tokens: int = 300, embedder=None) -> "PassageIndex":
+        """Split every page into passages of about passage_tokens tokens and index them."""
+        passages = []
+        for page_num, page_text in enumerate(pages, start=1):
+            for text in chunk_text(page_text, max_tokens=passage_tokens):
+                passages.append(Passage(len(passages), page_num, text))
+        return cls(passages, embedder)
+
+    def _bm25(self, query: str) -> dict[int, float]:
+        scores = defaultdict(float)
+        total = len(self.passages)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage_id, freq in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[passage_id] / self.avg_length
+                scores[passage_id] += idf * freq * (BM25_K1 + 1) / (freq + BM25_K1 * norm)
+        return scores
+
+    def search(self, query: str, k: int = 5) -> list[Passage]:
+        """Return the k passages most relevant to the query, best first."""
+        lexical = sorted(self._bm25(query).items(), key=lambda item: -item[1])
+        if self.vectors is None:
+            ranked = [passage_id for passage_id, _ in lexical]
+        else:
+            query_vector = self.embedder.embed([query])[0]
+            similarity = [sum(a * b for a, b in zip(query_vector, v)) for v in self.vectors]
+            semantic = sorted(range(len(self.passages)), key=lambda i: -similarity[i])
+            fused = defaultdict(float)
+            for ranking in ([passage_id for passage_id, _ in lexical], semantic):
+                for rank, passage_id in enumerate(ranking):
+                    fused[passage_id] += 1 / (RRF_K + rank + 1)
+            ranked = sorted(fused, key=lambda i: -fused[i])
+        return [self.passages[i] for i in ranked[:k]]
@@ -0,0 +1,131 @@
+"""Comparison of a revised document with its previous version.
+
+Clauses are compared article by article when the document has article
+headings, otherwise paragraph by paragraph. The resulting changes are
+shown to the user and passed to the final prompt, while the chunk
+results of the previous version are reused for everything that did not
+change (see chunker.rechunk_text and job_store.JobCheckpoint).
+"""
+import difflib
+import re
+from dataclasses import dataclass, field
+from src.chunker import ARTICLE_PATTERN, PARAGRAPH_PATTERN, split_sections
+
+# Changed clauses quoted in the final prompt; the rest are only counted
+MAX_PROMPT_CHANGES = 40
+# Characters of each clause quoted in the report and the prompt
+EXCERPT_CHARS = 600
+LABEL_CHARS = 60
+# Replaced clauses at least this similar are reported as modified rather than removed and added
+MODIFIED_MIN_SIMILARITY = 0.5
+# Unchanged words kept around each edit in the highlighted diff
+CONTEXT_WORDS = 8
+
+@dataclass
+class Change:
+    kind: str  # "added", "removed" or "modified"
+    label: str  # article heading or paragraph number in the new version ("Član 5", "stav 12")
+    old: str = ""
+    new: str = ""
+
+@dataclass
+class Revision:
+    """A document version linked to the one it revises."""
+    number: int
+    previous_number: int
+    previous_text: str
+    changes: list[Change]
+    # Chunk size -> chunks the previous version was analyzed with, and the ones chosen for this version
+    previous_chunks: dict[int, list[str]] = field(default_factory=dict)
+    chunks: dict[int, list[str]] = field(default_factory=dict)
+
+def split_clauses(text: str) -> list[str]:
+    """Articles when the text has article headings, otherwise paragraphs."""
+    if ARTICLE_PATTERN.search(text):
+        return [section.strip() for section in split_sections(text)]
+    return [paragraph.strip() for paragraph in PARAGRAPH_PATTERN.split(text) if paragraph.strip()]
+
+def _comparable(clause: str) -> str:
+    return re.sub(r"\s+", " ", clause).strip()
+
+def _label(clause: str, position: int) -> str:
+    if ARTICLE_PATTERN.match(clause):
+        # The whole heading line, so "Član 2a" is not reported as "Član 2"
+        return clause.split("\n", 1)[0].strip()[:LABEL_CHARS]
+    return f"stav {position + 1}"
+
+def diff_documents(old: str, new: str) -> list[Change]:
+    """Clause-level differences between two versions, in the order of the new version."""
+    old_clauses, new_clauses = split_clauses(old), split_clauses(new)
+    matcher = difflib.SequenceMatcher(
+        None, [_comparable(c) for c in old_clauses], [_comparable(c) for c in new_clauses], autojunk=False
+    )
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        unpaired = list(range(i1, i2))
+        for j in range(j1, j2):
+            label = _label(new_clauses[j], j)
+            match = next((
+                i for i in unpaired
+                if _label(old_clauses[i], i) == label
+                or difflib.SequenceMatcher(None, old_clauses[i], new_clauses[j], autojunk=False).ratio() >= MODIFIED_MIN_SIMILARITY
+            ), None)
+            if match is None:
+                changes.append(Change("added", label, new=new_clauses[j]))
+            else:
+                unpaired.remove(match)
+                changes.append(Change("modified", label, old_clauses[match], new_clauses[j]))
+        changes.extend(Change("removed", _label(old_clauses[i], i), old=old_clauses[i]) for i in unpaired)
+    return changes
+
+def _excerpt(text: str) -> str:
+    text = _comparable(text)
+    return text if len(text) <= EXCERPT_CHARS else text[:EXCERPT_CHARS].rsplit(" ", 1)[0] + " …"
+
+def _word_diff(old: str, new: str) -> str:
+    """Markdown of the new text with removed words struck through, added words in bold and long unchanged runs elided."""
+    old_words, new_words = _comparable(old).split(), _comparable(new).split()
+    parts = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_words, new_words, autojunk=False).get_opcodes():
+        if tag == "equal":
+            words = old_words[i1:i2]
+            if len(words) > 2 * CONTEXT_WORDS:
+                words = words[:CONTEXT_WORDS] * (i1 > 0) + ["…"] + words[-CONTEXT_WORDS:] * (i2 < len(old_words))
+            parts.append(" ".join(words))
+            continue
+        if tag in ("replace", "delete"):
+            parts.append(f"~~{_excerpt(' '.join(old_words[i1:i2]))}~~")
+        if tag in ("replace", "insert"):
+            parts.append(f"**{_excerpt(' '.join(new_words[j1:j2]))}**")
+    return " ".join(parts)
+
+def render_changes(revision: Revision) -> str:
+    """Markdown report of what changed since the previous version."""
+    title = f"### Izmene u odnosu na verziju {revision.previous_number}"
+    if not revision.changes:
+        return f"{title}\n\nTekst je nepromenjen.\n\n"
+    lines = [title, ""]
+    for change in revision.changes:
+        if change.kind == "added":
+            lines.append(f"- **{change.label}** (novo): {_excerpt(change.new)}")
+        elif change.kind == "removed":
+            lines.append(f"- **{change.label}** (brisano): ~~{_excerpt(change.old)}~~")
+        else:
+            lines.append(f"- **{change.label}** (izmenjeno): {_word_diff(change.old, change.new)}")
+    return "\n".join(lines) + "\n\n---\n\n"
+
+def changes_for_prompt(revision: Revision) -> str:
+    """Plain-text list of the changes for the final prompt."""
+    lines = []
+    for change in revision.changes[:MAX_PROMPT_CHANGES]:
+        if change.kind == "added":
+            lines.append(f"- {change.label} (novo): {_excerpt(change.new)}")
+        elif change.kind == "removed":
+            lines.append(f"- {change.label} (brisano): {_excerpt(change.old)}")
+        else:
+            lines.append(f"- {change.label} (izmenjeno)\n  ranije: {_excerpt(change.old)}\n  sada: {_excerpt(change.new)}")
+    if len(revision.changes) > MAX_PROMPT_CHANGES:
+        lines.append(f"- … i još {len(revision.changes) - MAX_PROMPT_CHANGES} izmena")
+    return "\n".join(lines) or "Nema izmena."
@@ -0,0 +1,279 @@
+"""Persistent full-text index over every processed document.
+
+Pages are tokenized with retrieval.tokenize, the same Serbian folding
+the passage index uses: Cyrillic is transliterated to Latin and
+diacritics are dropped, so "члан 154", "Član 154" and "clan 154" are
+the same query. Postings keep token positions per page,
+which makes phrase queries ("\"član 154\" ZOO") and page-level hits
+possible without any LLM call.
+
+    python -m src.search_index search '"član 154" zoo'
+    python -m src.search_index delete <document key>
+    python -m src.search_index stats
+"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+import numpy as np
+from src.retrieval import WORD_PATTERN, tokenize
+
+PHRASE_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+
+# Characters of page text shown around the first match
+SNIPPET_CHARS = 160
+# SQLite limits the number of bound parameters per statement
+_BATCH = 500
+# Above this many candidate documents a term's whole posting list is cheaper to read than IN (...) lookups
+CANDIDATE_DOCUMENTS_LIMIT = 2000
+
+@dataclass
+class SearchHit:
+    document_key: str
+    name: str
+    page: int
+    score: float
+    matches: int
+    snippet: str
+
+def parse_query(query: str) -> list[list[str]]:
+    """Split a query into phrases: quoted text is one phrase, every other word a phrase of its own."""
+    phrases = []
+    for quoted, word in PHRASE_PATTERN.findall(query):
+        tokens = tokenize(quoted or word)
+        if quoted and tokens:
+            phrases.append(tokens)
+        else:
+            phrases.extend([token] for token in tokens)
+    return phrases
+
+def _batches(items: list, size: int = _BATCH):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _positions(blob: bytes) -> array:
+    return array("I", blob)
+
+def _phrase_starts(blobs: dict[str, bytes], phrase: list[str]) -> list[int]:
+    """Positions on a page where the phrase starts."""
+    if len(phrase) == 1:
+        return list(_positions(blobs[phrase[0]]))
+    following = [set(_positions(blobs[term])) for term in phrase[1:]]
+    return [p for p in _positions(blobs[phrase[0]]) if all(p + i in positions for i, positions in enumerate(following, start=1))]
+
+def _phrase_counts(pages: list[dict[str, bytes]], phrase: list[str]) -> np.ndarray:
+    """Occurrences of the phrase on each page, computed for all pages at once."""
+    if len(phrase) == 1:
+        # Positions are 4-byte integers, so single words are counted without decoding them
+        return np.array([len(blobs[phrase[0]]) // 4 for blobs in pages], dtype=np.int64)
+    starts = None
+    for offset, term in enumerate(phrase):
+        blobs = [blobs[term] for blobs in pages]
+        positions = np.frombuffer(b"".join(blobs), dtype=np.uint32).astype(np.int64)
+        owners = np.repeat(np.arange(len(pages), dtype=np.int64), [len(blob) // 4 for blob in blobs])
+        keep = positions >= offset
+        # (page, start) pairs packed into one integer so the phrase terms can be intersected in a single pass
+        packed = (owners[keep] << 32) | (positions[keep] - offset)
+        starts = packed if starts is None else np.intersect1d(starts, packed, assume_unique=True)
+    return np.bincount(starts >> 32, minlength=len(pages))
+
+def _snippet(text: str, position: int, length: int) -> str:
+    """Page text around the tokens [position, position + length), with the match in bold."""
+    spans = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if position < 0 or position + length > len(spans):
+        return re.sub(r"\s+", " ", text[:SNIPPET_CHARS]).strip()
+    start, end = spans[position][0], spans[position + length - 1][1]
+    before = text[max(0, start - SNIPPET_CHARS // 2):start]
+    after = text[end:end + SNIPPET_CHARS // 2]
+    clean = lambda part: re.sub(r"\s+", " ", part)
+    return f"…{clean(before)}**{clean(text[start:end])}**{clean(after)}…"
+
+class SearchIndex:
+    """Inverted index of document pages with token positions, stored in SQLite.
+
+    Documents are added and deleted incrementally by key (the SHA-256 of
+    the PDF). Queries match pages containing every phrase; pages are
+    ranked by a TF-IDF score over page frequencies.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Batch workers and the app may write to the same file
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, name TEXT NOT NULL, page_count INTEGER NOT NULL, added REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "doc_id INTEGER NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (doc_id, page));"
+            "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE NOT NULL, df INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term_id INTEGER NOT NULL, doc_id INTEGER NOT NULL, page INTEGER NOT NULL, positions BLOB NOT NULL, "
+            "PRIMARY KEY (term_id, doc_id, page)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);"
+        )
+        self._conn.commit()
+
+    def add_document(self, key: str, name: str, pages: list[str]):
+        """Index a document's pages (numbered from 1), replacing any earlier copy with the same key."""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        postings = {}  # term -> [(page, positions)]
+        for page_number, text in enumerate(pages, start=1):
+            positions = {}
+            for position, term in enumerate(tokenize(text)):
+                positions.setdefault(term, array("I")).append(position)
+            for term, found in positions.items():
+                postings.setdefault(term, []).append((page_number, found.tobytes()))
+        with self._lock:
+            self._delete(key)
+            doc_id = self._conn.execute(
+                "INSERT INTO documents (key, name, page_count, added) VALUES (?, ?, ?, ?)", (key, name, len(pages), time.time())
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO pages (doc_id, page, text) VALUES (?, ?, ?)",
+                [(doc_id, page_number, text) for page_number, text in enumerate(pages, start=1)]
+            )
+            terms = list(postings)
+            self._conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", [(term,) for term in terms])
+            term_ids = {}
+            for batch in _batches(terms):
+                term_ids.update((term, term_id) for term_id, term in self._conn.execute(
+                    f"SELECT id, term FROM terms WHERE term IN ({','.join('?' * len(batch))})", batch
+                ))
+            self._conn.executemany(
+                "INSERT INTO postings (term_id, doc_id, page, positions) VALUES (?, ?, ?, ?)",
+                [(term_ids[term], doc_id, page, positions) for term, rows in postings.items() for page, positions in rows]
+            )
+            self._conn.executemany(
+                "UPDATE terms SET df = df + ? WHERE id = ?", [(len(rows), term_ids[term]) for term, rows in postings.items()]
+            )
+            self._conn.commit()
+        logging.info(f"Indexed {name}: {len(pages)} pages, {len(postings)} terms in {time.perf_counter() - started:.2f}s")
+
+    def delete_document(self, key: str) -> bool:
+        """Remove a document from the index; returns False if it was not indexed."""
+        with self._lock:
+            deleted = self._delete(key)
+            self._conn.commit()
+        return deleted
+
+    def _delete(self, key: str) -> bool:
+        row = self._conn.execute("SELECT id FROM documents WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        doc_id = row[0]
+        counts = self._conn.execute("SELECT term_id, COUNT(*) FROM postings WHERE doc_id = ? GROUP BY term_id", (doc_id,)).fetchall()
+        self._conn.executemany("UPDATE terms SET df = df - ? WHERE id = ?", [(count, term_id) for term_id, count in counts])
+        self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        self._conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+        self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return True
+
+    def search(self, query: str, limit: int = 20) -> list[SearchHit]:
+        """Pages containing every phrase of the query, best first."""
+        phrases = parse_query(query)
+        if not phrases:
+            return []
+        terms = sorted({term for phrase in phrases for term in phrase})
+        with self._lock:
+            found = {
+                term: (term_id, df) for term_id, term, df in self._conn.execute(
+                    f"SELECT id, term, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", terms
+                )
+            }
+            if len(found) < len(terms) or any(df <= 0 for _, df in found.values()):
+                return []
+            # Start from the rarest term and only fetch the other terms' postings for the candidate documents
+            candidates = None
+            for term in sorted(terms, key=lambda term: found[term][1]):
+                term_id = found[term][0]
+                doc_ids = sorted({doc_id for doc_id, _ in candidates}) if candidates is not None else []
+                if candidates is None or len(doc_ids) > CANDIDATE_DOCUMENTS_LIMIT:
+                    rows = self._conn.execute("SELECT doc_id, page, positions FROM postings WHERE term_id = ?", (term_id,)).fetchall()
+                else:
+                    rows = []
+                    for batch in _batches(doc_ids):
+                        rows += self._conn.execute(
+                            f"SELECT doc_id, page, positions FROM postings WHERE term_id = ? AND doc_id IN ({','.join('?' * len(batch))})",
+                            [term_id, *batch]
+                        ).fetchall()
+                if candidates is None:
+                    candidates = {(doc_id, page): {term: positions} for doc_id, page, positions in rows}
+                else:
+                    matched = {}
+                    for doc_id, page, positions in rows:
+                        blobs = candidates.get((doc_id, page))
+                        if blobs is not None:
+                            blobs[term] = positions
+                            matched[(doc_id, page)] = blobs
+                    candidates = matched
+                if not candidates:
+                    return []
+            total_pages = self._conn.execute("SELECT COALESCE(SUM(page_count), 0) FROM documents").fetchone()[0]
+
+        keys = list(candidates)
+        scores = np.zeros(len(keys))
+        matches = np.zeros(len(keys), dtype=np.int64)
+        for phrase in phrases:
+            counts = _phrase_counts([candidates[key] for key in keys], phrase)
+            idf = max(math.log(1 + total_pages / found[term][1]) for term in phrase)
+            scores += idf * (1 + np.log(np.maximum(counts, 1))) * len(phrase)
+            scores[counts == 0] = -np.inf
+            matches += counts
+        order = [i for i in np.argsort(-scores, kind="stable")[:limit] if scores[i] > -np.inf]
+
+        hits = []
+        with self._lock:
+            for i in order:
+                doc_id, page = keys[i]
+                key, name = self._conn.execute("SELECT key, name FROM documents WHERE id = ?", (doc_id,)).fetchone()
+                text = self._conn.execute("SELECT text FROM pages WHERE doc_id = ? AND page = ?", (doc_id, page)).fetchone()[0]
+                start = _phrase_starts(candidates[(doc_id, page)], phrases[0])[0]
+                hits.append(SearchHit(key, name, page, float(scores[i]), int(matches[i]), _snippet(text, start, len(phrases[0]))))
+        return hits
+
+    def documents(self) -> list[tuple[str, str, int]]:
+        """(key, name, page count) of every indexed document."""
+        with self._lock:
+            return self._conn.execute("SELECT key, name, page_count FROM documents ORDER BY added").fetchall()
+
+    def stats(self) -> dict:
+        with self._lock:
+            documents, pages = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(page_count), 0) FROM documents").fetchone()
+            terms = self._conn.execute("SELECT COUNT(*) FROM terms WHERE df > 0").fetchone()[0]
+        return {"documents": documents, "pages": pages, "terms": terms}
+
+def search_index_from_env() -> SearchIndex:
+    """Build the index from SEARCH_INDEX_* environment variables."""
+    try:
+        return SearchIndex(
+            os.getenv("SEARCH_INDEX_PATH", os.path.join(".cache", "search_index.sqlite")),
+            enabled=os.getenv("SEARCH_INDEX_DISABLED", "").lower() not in ("1", "true", "yes")
+        )
+    except Exception as e:
+        logging.warning(f"Search index unavailable, falling back to in-memory index: {e}")
+        return SearchIndex(":memory:")
+
+if __name__ == "__main__":
+    index = search_index_from_env()
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "search":
+        for hit in index.search(" ".join(sys.argv[2:])):
+            print(f"{hit.name} p.{hit.page} ({hit.matches}x): {hit.snippet}")
+    elif command == "delete":
+        for key in sys.argv[2:]:
+            print(f"{key}: {'deleted' if index.delete_document(key) else 'not indexed'}")
+    else:
+        print(index.stats())
@@ -0,0 +1,194 @@
+"""Clean-up pass between extraction and chunking.
+
+Court filings repeat the same header and footer on every page (court
+name, case number, "Strana 3 od 12", stamps), split words across line
+breaks and, when scanned, carry OCR noise from stamps, signatures and
+margins. None of it helps the model, so it is removed before the text is
+chunked and prompted.
+"""
+import os
+import re
+import math
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from src.chunker import ARTICLE_PATTERN, count_tokens
+from src import metrics
+
+# Lines at the top and bottom of each page that are candidates for headers and footers
+EDGE_LINES = int(os.getenv("NORMALIZE_EDGE_LINES", "3"))
+# A line is a header or footer when it sits at the edge of at least this fraction of pages
+REPEAT_MIN_FRACTION = float(os.getenv("NORMALIZE_REPEAT_FRACTION", "0.5"))
+# Fewer pages than this give no reliable evidence of repetition
+REPEAT_MIN_PAGES = 3
+# OCR lines with a smaller share of letters and digits are treated as noise
+OCR_MIN_ALNUM_RATIO = float(os.getenv("NORMALIZE_OCR_MIN_ALNUM", "0.6"))
+OCR_SOURCES = ("ocr", "ocr_failed")
+
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^[-–—\s]*(?:(?:strana|str\.|page|страна|стр\.)\s*)?\d+(?:\s*(?:od|of|/|од)\s*\d+)?[-–—\s]*$",
+    re.IGNORECASE
+)
+# "Strana 3 od 12" names itself; a bare "3" or "3/12" could be an amount, a year or a case number
+LABELED_PAGE_NUMBER_PATTERN = re.compile(r"^[-–—\s]*(?:strana|str\.|page|страна|стр\.)", re.IGNORECASE)
+# A word broken with a hyphen at the end of a line and continued in lower case on the next
+HYPHENATION_PATTERN = re.compile(r"([^\W\d_])[-\u00ad]\n[ \t]*(?=[a-zčćđšžа-яђјљњћџ])")
+HORIZONTAL_SPACE_PATTERN = re.compile(r"[ \t\u00a0\u200b]+")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+# "a)" or "1." on a line of its own is an enumeration, not noise
+LIST_MARKER_PATTERN = re.compile(r"\w[.)]")
+
+@dataclass
+class NormalizationStats:
+    pages: int = 0
+    repeated_lines: int = 0  # header, footer and page-number lines removed
+    noise_lines: int = 0  # OCR fragments removed
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.tokens_saved / self.tokens_before if self.tokens_before else 0.0
+
+def _is_labeled_page_number(line: str) -> bool:
+    return bool(PAGE_NUMBER_PATTERN.match(line) and LABELED_PAGE_NUMBER_PATTERN.match(line))
+
+def _is_bare_number(line: str) -> bool:
+    return bool(PAGE_NUMBER_PATTERN.match(line)) and not LABELED_PAGE_NUMBER_PATTERN.match(line)
+
+def _line_key(line: str) -> str:
+    """Compare lines ignoring case and spacing; numbers are only ignored in labeled page-number lines.
+
+    Any other line must repeat exactly: lines that differ only by a number
+    ("Ukupno: 1.200 dinara", "Rešenje br. 7", a bare "150000") are content.
+    """
+    key = HORIZONTAL_SPACE_PATTERN.sub(" ", line.lower()).strip()
+    if _is_labeled_page_number(line):
+        return re.sub(r"\d+", "#", key)
+    return key
+
+def _edges(lines: list[str]) -> list[tuple[str, list[int]]]:
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return [("top", filled[:EDGE_LINES]), ("bottom", filled[::-1][:EDGE_LINES])]
+
+def _repeated_keys(pages: list[list[str]]) -> set:
+    if len(pages) < REPEAT_MIN_PAGES:
+        return set()
+    counts = Counter()
+    for lines in pages:
+        filled = [line for line in lines if line.strip()]
+        counts.update({_line_key(line) for line in filled[:EDGE_LINES] + filled[-EDGE_LINES:]})
+    threshold = max(2, math.ceil(REPEAT_MIN_FRACTION * len(pages)))
+    return {key for key, count in counts.items() if count >= threshold and key}
+
+def _page_number_lines(pages: list[list[str]]) -> list[set]:
+    """Per page, the indexes of bare numbers at its edges that are page numbers.
+
+    A bare number only counts as one with evidence from other pages: it
+    follows the page's position (page index plus the same offset) on at
+    least REPEAT_MIN_PAGES pages, or bare numbers sit at the same edge of
+    at least that many pages and REPEAT_MIN_FRACTION of them.
+    """
+    candidates = []
+    for page, lines in enumerate(pages):
+        for edge, indexes in _edges(lines):
+            for i in indexes:
+                if _is_bare_number(lines[i]):
+                    candidates.append((page, i, edge, int(re.search(r"\d+", lines[i]).group()) - page))
+    # Pages per offset and per edge, each page counted once
+    offset_pages = Counter(offset for _, offset in {(page, offset) for page, _, _, offset in candidates})
+    edge_pages = Counter(edge for _, edge in {(page, edge) for page, _, edge, _ in candidates})
+    edge_threshold = max(REPEAT_MIN_PAGES, math.ceil(REPEAT_MIN_FRACTION * len(pages)))
+    accepted = [set() for _ in pages]
+    for page, i, edge, offset in candidates:
+        if offset_pages[offset] >= REPEAT_MIN_PAGES or edge_pages[edge] >= edge_threshold:
+            accepted[page].add(i)
+    return accepted
+
+def _is_header_footer(line: str, repeated: set) -> bool:
+    # Article headings open most pages of a statute; the chunker needs them
+    if ARTICLE_PATTERN.match(line):
+        return False
+    return _line_key(line) in repeated or _is_labeled_page_number(line)
+
+def _header_footer_indexes(lines: list[str], repeated: set, page_numbers: set = frozenset()) -> set:
+    """Repeated lines peeled off the top and bottom of a page, stopping at the first line of body text.
+
+    page_numbers are the indexes of bare numbers known to be page numbers
+    (see _page_number_lines). A page is never emptied: when every line
+    looks like a header or footer, the page is kept as it is.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    drop = set()
+    for _, edge in _edges(lines):
+        for i in edge:
+            if i not in page_numbers and not _is_header_footer(lines[i], repeated):
+                break
+            drop.add(i)
+    if len(drop) == len(filled):
+        return set()
+    return drop
+
+def is_ocr_noise(line: str) -> bool:
+    """Stray marks, stamp and signature debris: mostly symbols, or a lone one- or two-character fragment."""
+    visible = line.replace(" ", "")
+    if not visible or LIST_MARKER_PATTERN.fullmatch(visible):
+        return False
+    alnum = sum(ch.isalnum() or ch == "§" for ch in visible)
+    if alnum / len(visible) < OCR_MIN_ALNUM_RATIO:
+        return True
+    return len(visible) <= 2 and not visible.isdigit()
+
+def collapse_whitespace(text: str) -> str:
+    lines = (HORIZONTAL_SPACE_PATTERN.sub(" ", line).strip() for line in text.split("\n"))
+    return BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip()
+
+def join_hyphenated(text: str) -> str:
+    return HYPHENATION_PATTERN.sub(r"\1", text)
+
+def normalize_pages(pages: list[str], sources: list[str] = None) -> tuple[list[str], NormalizationStats]:
+    """Normalize a document page by page; pages keep their positions so page numbers stay valid.
+
+    `sources` are the PageText sources; noise filtering only applies to OCR'd pages.
+    """
+    sources = sources or [""] * len(pages)
+    stats = NormalizationStats(pages=len(pages), tokens_before=count_tokens("\n".join(pages)))
+    split = []
+    for page, source in zip(pages, sources):
+        lines = page.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        if source in OCR_SOURCES:
+            kept = [line for line in lines if not is_ocr_noise(line)]
+            stats.noise_lines += len(lines) - len(kept)
+            lines = kept
+        split.append(lines)
+    repeated = _repeated_keys(split)
+    page_numbers = _page_number_lines(split)
+
+    normalized = []
+    for lines, numbers in zip(split, page_numbers):
+        drop = _header_footer_indexes(lines, repeated, numbers)
+        stats.repeated_lines += len(drop)
+        text = "\n".join(line for i, line in enumerate(lines) if i not in drop)
+        normalized.append(collapse_whitespace(join_hyphenated(text)))
+
+    stats.tokens_after = count_tokens("\n".join(normalized))
+    metrics.registry.inc("legal_normalizer_tokens_total", stats.tokens_before, stage="before")
+    metrics.registry.inc("legal_normalizer_tokens_total", stats.tokens_after, stage="after")
+    metrics.log_event(
+        "normalize", pages=stats.pages, repeated_lines=stats.repeated_lines, noise_lines=stats.noise_lines,
+        tokens_before=stats.tokens_before, tokens_after=stats.tokens_after, saved_ratio=round(stats.saved_ratio, 4)
+    )
+    logging.info(
+        f"Normalization removed {stats.repeated_lines} repeated and {stats.noise_lines} noise lines, "
+        f"saving {stats.tokens_saved} of {stats.tokens_before} tokens ({stats.saved_ratio:.1%})"
+    )
+    return normalized, stats
+
+def normalize_records(records) -> tuple[list[str], NormalizationStats]:
+    """normalize_pages for PageText records from the extractor."""
+    records = list(records)
+    return normalize_pages([record.text for record in records], [record.source for record in records])
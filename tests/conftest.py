@@ -0,0 +1,7 @@
+import os
+
+# Deterministic offline model and no shared on-disk caches for the whole suite
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.pop("OPENAI_API_KEY", None)
+for flag in ("LLM_CACHE_DISABLED", "EXTRACTION_CACHE_DISABLED", "NEAR_DUPLICATE_DISABLED", "SEARCH_INDEX_DISABLED"):
+    os.environ[flag] = "1"
@@ -0,0 +1,64 @@
+import asyncio
+from src import agents
+from src.document_processor import LegalDocumentProcessor
+from src.job_store import JobStore, run_job
+from src.near_duplicates import NearDuplicateIndex
+
+CLAUSE = "Zakupac je dužan da plaća zakupninu do petog u mesecu i da održava prostor u ispravnom stanju."
+
+def contract(changed: dict = {}) -> str:
+    articles = [f"Član {n}\n{changed.get(n, f'{CLAUSE} Odredba broj {n}. ' * 8)}" for n in range(1, 80)]
+    return "UGOVOR O ZAKUPU\n\n" + "\n\n".join(articles)
+
+def run_worker(store: JobStore, processor: LegalDocumentProcessor) -> tuple[dict, int]:
+    calls = agents.get_model().calls
+    job = store.claim_next_job("test-worker")
+    result = asyncio.run(run_job(store, processor, job))
+    return result, agents.get_model().calls - calls
+
+def test_worker_resumes_revision_job_incrementally(tmp_path):
+    store = JobStore(f"sqlite:///{tmp_path / 'jobs.sqlite'}")
+    processor = LegalDocumentProcessor()
+    v1_text = contract()
+    v1 = store.add_version(v1_text, "v1.pdf")
+    store.open_job(v1_text, "contract_analysis", version_id=v1.id)
+    _, v1_calls = run_worker(store, processor)
+
+    v2_text = contract({5: "Zakupnina iznosi 60.000 dinara mesečno."})
+    v2 = store.add_version(v2_text, "v2.pdf", v1.id)
+    job_id = store.open_job(v2_text, "contract_analysis", version_id=v2.id)
+    assert store.get_job(job_id).version_id == v2.id
+    result, v2_calls = run_worker(store, processor)
+
+    assert result["result"].startswith("### Izmene u odnosu na verziju 1")
+    assert v2_calls < v1_calls
+    assert store.get_job(job_id).status == "done"
+
+def analyze_versions(store: JobStore, processor: LegalDocumentProcessor, texts: list[str]) -> list[tuple[str, int]]:
+    """Analyze each text as the next version of the previous one; the analysis after the change list and its model calls."""
+    outputs, previous = [], None
+    for number, text in enumerate(texts, start=1):
+        version = store.add_version(text, f"v{number}.pdf", previous)
+        store.open_job(text, "contract_analysis", version_id=version.id)
+        result, calls = run_worker(store, processor)
+        outputs.append((result["result"].split("\n\n---\n\n", 1)[-1], calls))
+        previous = version.id
+    return outputs
+
+def test_revision_reanalyzes_changed_clause_with_near_duplicates_enabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(agents, "near_duplicates", NearDuplicateIndex(str(tmp_path / "near.sqlite")))
+    store = JobStore(f"sqlite:///{tmp_path / 'jobs.sqlite'}")
+    v1_text = contract()
+    v2_text = contract({5: f"{CLAUSE} Odredba broj 5. ".replace("zakupninu", "kaparu") * 8})
+    (v1, _), (v2, v2_calls) = analyze_versions(store, LegalDocumentProcessor(), [v1_text, v2_text])
+    assert v2_calls > 0
+    assert v2 != v1
+
+def test_unchanged_revision_does_not_reuse_previous_final_output(tmp_path):
+    store = JobStore(f"sqlite:///{tmp_path / 'jobs.sqlite'}")
+    v1_text = contract()
+    v2_text = contract({5: "Zakupnina iznosi 60.000 dinara mesečno."})
+    _, (v2, _), (v3, v3_calls) = analyze_versions(store, LegalDocumentProcessor(), [v1_text, v2_text, v2_text])
+    # Same chunks as v2, but the final prompt now lists no changes
+    assert v3_calls == 1
+    assert v3 != v2
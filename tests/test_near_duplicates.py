@@ -0,0 +1,36 @@
+import asyncio
+import time
+from src import agents
+from src.near_duplicates import NearDuplicateIndex
+
+CLAUSE = " ".join(f"Član {n}. Zakupac je dužan da plaća zakupninu do petog u mesecu i da prostor broj {n} održava u ispravnom stanju." for n in range(1, 30))
+
+def notes(index: NearDuplicateIndex, chunk: str) -> tuple[str, int]:
+    calls = agents.get_model().calls
+    output = asyncio.run(agents.run_chunked_prompt(agents.notes_prompt_for("contract_analysis"), [chunk], near_duplicates=index))[0]
+    return output, agents.get_model().calls - calls
+
+def test_same_words_in_another_layout_reuse_the_analysis(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "near.sqlite"))
+    output, _ = notes(index, CLAUSE)
+    relaid = CLAUSE.upper().replace(" ", "\n", 30).replace("š", "s")
+    assert notes(index, relaid) == (output, 0)
+
+def test_changed_word_is_analyzed_again_with_its_diff(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "near.sqlite"))
+    notes(index, CLAUSE)
+    changed = CLAUSE.replace("plaća zakupninu", "plaća kaparu", 1)
+    scope = NearDuplicateIndex.make_scope(agents.get_model().model_name, agents.PROMPT_VERSION, agents.notes_prompt_for("contract_analysis"))
+    match = index.lookup(scope, changed)
+    assert match is not None and not match.exact
+    prompt = agents.template_text(changed, match)
+    assert "[kaparu]" in prompt and "(ranije: [zakupninu])" in prompt
+    _, calls = notes(index, changed)
+    assert calls == 1
+
+def test_stale_entries_are_evicted_on_open(tmp_path):
+    path = str(tmp_path / "near.sqlite")
+    index = NearDuplicateIndex(path, max_age=0.01)
+    index.add("scope", CLAUSE, "notes")
+    time.sleep(0.05)
+    assert NearDuplicateIndex(path, max_age=0.01).stats()["entries"] == 0
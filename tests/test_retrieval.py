@@ -0,0 +1,47 @@
+from src import retrieval
+from src.retrieval import PassageIndex, tokenize
+from src.search_index import SearchIndex
+
+PAGES = [
+    "Član 154 Zakona o obligacionim odnosima uređuje odgovornost za štetu.",
+    "Zakupnina se plaća do petog u mesecu.",
+]
+
+def test_tokenize_folds_scripts_and_diacritics():
+    assert tokenize("ЧЛАН 154 ђак") == tokenize("Član 154 Đak") == ["clan", "154", "djak"]
+
+def test_passage_index_and_search_index_agree_on_cyrillic_queries():
+    passages = PassageIndex.from_pages(PAGES).search("члан 154 одговорност", k=1)
+    assert passages[0].page == 1
+    index = SearchIndex(":memory:")
+    index.add_document("key", "ugovor.pdf", PAGES)
+    hits = index.search('"члан 154" одговорност')
+    assert [hit.page for hit in hits] == [1]
+
+def test_embedder_is_selected_by_setting(monkeypatch):
+    class KeywordEmbedder:
+        def __init__(self, model_name):
+            self.model_name = model_name
+
+        def embed(self, texts):
+            return [[float("štet" in text), 1.0] for text in texts]
+
+    monkeypatch.setattr(retrieval, "SentenceTransformerEmbedder", KeywordEmbedder)
+    for setting, expected in (("", None), ("local-model", "local-model")):
+        monkeypatch.setattr(retrieval, "RETRIEVAL_EMBEDDER", setting)
+        retrieval.get_embedder.cache_clear()
+        embedder = retrieval.get_embedder()
+        assert getattr(embedder, "model_name", None) == expected
+    index = PassageIndex.from_pages(PAGES, embedder=retrieval.get_embedder())
+    assert index.vectors is not None
+    retrieval.get_embedder.cache_clear()
+
+def test_missing_embedding_backend_falls_back_to_bm25(monkeypatch):
+    def unavailable(model_name):
+        raise ImportError("sentence-transformers is required for the embedding retrieval backend")
+
+    monkeypatch.setattr(retrieval, "SentenceTransformerEmbedder", unavailable)
+    monkeypatch.setattr(retrieval, "RETRIEVAL_EMBEDDER", "local-model")
+    retrieval.get_embedder.cache_clear()
+    assert retrieval.get_embedder() is None
+    retrieval.get_embedder.cache_clear()
@@ -0,0 +1,40 @@
+from src.text_normalizer import normalize_pages
+
+HEADER = "OSNOVNI SUD U BEOGRADU\nPosl. br. P-1234/2024"
+
+def test_repeated_header_and_page_numbers_are_removed():
+    pages = [f"{HEADER}\nObrazloženje na strani {n} ovog rešenja.\nStrana {n} od 5" for n in range(1, 6)]
+    normalized, stats = normalize_pages(pages)
+    assert normalized == [f"Obrazloženje na strani {n} ovog rešenja." for n in range(1, 6)]
+    assert stats.repeated_lines == 15
+
+def test_edge_lines_that_differ_only_by_a_number_are_kept():
+    pages = [f"{HEADER}\nTekst strane {n}.\nUkupno: {n * 1200} dinara" for n in range(1, 6)]
+    normalized, _ = normalize_pages(pages)
+    assert normalized == [f"Tekst strane {n}.\nUkupno: {n * 1200} dinara" for n in range(1, 6)]
+
+def test_short_documents_are_never_emptied():
+    # Several one-page decisions scanned into one file: every line sits at a page edge
+    pages = [f"Rešenje br. {n}\nUkupno: {n * 1000} dinara" for n in range(1, 6)]
+    normalized, stats = normalize_pages(pages)
+    assert normalized == pages
+    assert stats.tokens_after == stats.tokens_before
+
+def test_page_made_only_of_repeated_lines_is_kept():
+    pages = [f"{HEADER}\nTekst strane {n}." for n in range(1, 5)] + [HEADER]
+    normalized, _ = normalize_pages(pages)
+    assert normalized[-1] == HEADER
+
+def test_bare_numbers_without_evidence_are_kept():
+    assert normalize_pages(["Ukupno dosuđeno:\n150000"])[0] == ["Ukupno dosuđeno:\n150000"]
+    assert normalize_pages(["Sud je odlučio\n2024"])[0] == ["Sud je odlučio\n2024"]
+    # Amounts closing a few pages of a longer document are not page numbers either
+    pages = [f"Tekst strane {n}.\n{n * 15000}" if n < 3 else f"Tekst strane {n}." for n in range(1, 9)]
+    assert normalize_pages(pages)[0] == pages
+
+def test_bare_page_numbers_following_page_positions_are_removed():
+    # Numbering starts at 2 because the cover page is unnumbered
+    pages = ["NASLOVNA STRANA"] + [f"Tekst strane {n}.\n- {n + 1} -" for n in range(1, 5)]
+    normalized, stats = normalize_pages(pages)
+    assert normalized == ["NASLOVNA STRANA"] + [f"Tekst strane {n}." for n in range(1, 5)]
+    assert stats.repeated_lines == 4